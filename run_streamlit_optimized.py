@@ -64,7 +64,6 @@ def initialize_workflow():
     """Inicializa el workflow con configuración optimizada"""
     try:
         from graph.workflow import create_marketing_workflow
-        from config.settings import settings
         
         # Crear workflow con configuración robusta
         workflow = create_marketing_workflow(enable_rag=True)  
@@ -94,6 +93,9 @@ async def process_marketing_prompt(workflow, prompt):
             "processing_time": 0,
             "error": str(e)
         }
+    finally:
+        # Cada asyncio.run usa un loop nuevo: cerrar sus conexiones HTTP antes de que termine
+        await workflow.aclose()
 
 def safe_get(obj, attr, default=None):
     """Safely get attribute from object or dict with fallback"""
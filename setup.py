@@ -8,6 +8,7 @@ setup(
     install_requires=[
         # Core dependencies
         "pydantic>=2.0.0",
+        "pydantic-settings>=2.0.0",
         "httpx>=0.24.0",
         "python-dotenv>=0.19.0",
         "loguru>=0.6.0",
@@ -14,6 +14,7 @@ from .visual_format_recommender import VisualFormatRecommender
 from .video_scripter import VideoScripter
 from .result_optimizer import ResultOptimizer
 from .contextual_awareness import ContextualAwarenessEngine
+from .fused_content import FusedContentAgent
 
 __all__ = [
     "PromptAnalyzer",
@@ -27,5 +28,6 @@ __all__ = [
     "VisualFormatRecommender",
     "VideoScripter",
     "ResultOptimizer",
-    "ContextualAwarenessEngine"
+    "ContextualAwarenessEngine",
+    "FusedContentAgent"
 ]
\ No newline at end of file
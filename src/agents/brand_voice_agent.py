@@ -7,7 +7,7 @@ from typing import Dict, Any
 
 from src.models.content_brief import BrandVoice
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -49,8 +49,9 @@ class BrandVoiceAgent:
             analysis_summary = self._create_analysis_summary(state["prompt_analysis"])
             post_type = state["post_type"].value
             
-            template = get_prompt_template(AGENT_TEMPLATES["brand_voice"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["brand_voice"],
+                language,
                 analysis=analysis_summary,
                 post_type=post_type
             )
@@ -7,7 +7,7 @@ from typing import Dict, Any
 
 from src.models.content_brief import EngagementElements
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +56,9 @@ class CaptionCreator:
             else:
                 objective = prompt_analysis.get('objective', 'Generar contenido atractivo')
             
-            template = get_prompt_template(AGENT_TEMPLATES["caption_creator"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["caption_creator"],
+                language,
                 core_content=core_content,
                 post_type=post_type,
                 brand_voice=brand_voice_summary,
@@ -116,11 +117,11 @@ class CaptionCreator:
         if hasattr(brand_voice, 'tone'):
             tone = brand_voice.tone
             personality = brand_voice.personality
-            communication_style = brand_voice.communication_style
+            communication_style = brand_voice.style
         else:
             tone = brand_voice.get('tone')
             personality = brand_voice.get('personality')
-            communication_style = brand_voice.get('communication_style')
+            communication_style = brand_voice.get('style')
         
         if tone:
             summary_parts.append(f"TONO: {tone}")
@@ -8,7 +8,9 @@ import random
 from datetime import datetime
 
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.settings import gemini_service_tier
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
+from src.graph.state import update_state_with_context
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +21,7 @@ class ContextualAwarenessEngine:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
+        self.service_tier = gemini_service_tier("contextual_awareness")
         self.logger = logging.getLogger(__name__)
         self.external_data = self._initialize_external_data()
     
@@ -194,8 +197,9 @@ class ContextualAwarenessEngine:
             
             base_strategy = self._summarize_base_strategy(state)
             
-            template = get_prompt_template(AGENT_TEMPLATES["contextual_awareness"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["contextual_awareness"],
+                language,
                 base_strategy=base_strategy,
                 external_data=str(external_data),
                 trends=str(relevant_trends)
@@ -205,7 +209,8 @@ class ContextualAwarenessEngine:
             self.logger.info("Generando ajustes contextuales con LLM")
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con ajustes contextuales"
+                expected_format="JSON con ajustes contextuales",
+                service_tier=self.service_tier
             )
             
             # Parsear respuesta
@@ -222,14 +227,8 @@ class ContextualAwarenessEngine:
                 "final_recommendations": final_recommendations,
             }
             
-            # Actualizar estado usando función de estado
-            from src.graph.state import update_state_with_context, WorkflowState
-            if isinstance(state, dict):
-                workflow_state = WorkflowState(**state)
-                workflow_state = update_state_with_context(workflow_state, contextual_data)
-                state.update(workflow_state.dict())
-            else:
-                state = update_state_with_context(state, contextual_data)
+            # Actualizar estado usando función de estado (en el sitio, sin reconstruir WorkflowState)
+            state = update_state_with_context(state, contextual_data)
             
             # Log del proceso
             processing_time = time.time() - start_time
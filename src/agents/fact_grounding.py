@@ -7,7 +7,7 @@ from typing import Dict, Any
 
 from src.models.content_brief import FactualGrounding
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -49,8 +49,9 @@ class FactGroundingAgent:
             else:
                 key_facts = analysis.get('key_facts', [])
             
-            template = get_prompt_template(AGENT_TEMPLATES["fact_grounding"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["fact_grounding"],
+                language,
                 prompt=state["input_prompt"],
                 key_facts=", ".join(key_facts) if key_facts else "No specific facts identified"
             )
@@ -0,0 +1,127 @@
+"""
+Agente Fused Content - Genera contenido principal, concepto visual y script de video en una sola llamada
+"""
+import logging
+import time
+from typing import Dict, Any
+
+from src.models.content_brief import VisualConcept
+from src.tools.llm_client import LLMClient
+from src.config.prompts import (
+    render_prompt, shared_context_block, AGENT_TEMPLATES, FUSED_VIDEO_SECTION, FUSED_VIDEO_SCHEMA
+)
+from src.agents.text_generator import TextGenerator
+from src.agents.visual_concept import VisualConceptAgent
+from src.agents.video_scripter import VideoScripter, is_video_format
+from src.graph.state import state_field
+
+logger = logging.getLogger(__name__)
+
+class FusedContentAgent:
+    """
+    Agente que sustituye las llamadas separadas de TextGenerator, VisualConceptAgent
+    y VideoScripter por una única llamada estructurada con el contexto compartido.
+    Si la respuesta fusionada no es válida, recurre al TextGenerator y deja el
+    concepto visual y el script a sus agentes habituales.
+    """
+
+    def __init__(self, llm_client: LLMClient):
+        self.llm = llm_client
+        self.text_generator = TextGenerator(llm_client)
+        self.visual_concept_agent = VisualConceptAgent(llm_client)
+        self.video_scripter = VideoScripter(llm_client)
+
+    async def process(self, state) -> Dict[str, Any]:
+        """
+        Procesa el estado y genera contenido, concepto visual y script de video
+
+        Args:
+            state: Estado del workflow
+
+        Returns:
+            Estado actualizado con el contenido generado
+        """
+        start = time.perf_counter()
+
+        try:
+            logger.info("Iniciando generación fusionada de contenido")
+
+            # Verificar que tenemos todos los elementos necesarios
+            required_elements = ["prompt_analysis", "post_type", "brand_voice", "factual_grounding"]
+            for element in required_elements:
+                if not state.get(element):
+                    raise ValueError(f"Elemento requerido no disponible: {element}")
+
+            # 1. Preparar prompt con el contexto compartido una sola vez
+            language_config = state.get("language_config") or {}
+            language = language_config.get("language", "es")
+
+            prompt_analysis = state["prompt_analysis"]
+            objective = state_field(prompt_analysis, 'objective')
+            platform = state_field(prompt_analysis, 'platform') or 'Instagram'
+
+            visual_format = (state.get("visual_format_recommendation") or {}).get("recommended_format", "Image")
+            include_video = is_video_format(visual_format)
+            duration = self.video_scripter._determine_duration(platform)
+
+            video_section = FUSED_VIDEO_SECTION.get(language, FUSED_VIDEO_SECTION["es"])
+            prompt = render_prompt(
+                AGENT_TEMPLATES["fused_content"],
+                language,
+                analysis=self.text_generator._create_analysis_summary(prompt_analysis),
+                post_type=state["post_type"].value,
+                brand_voice=self.visual_concept_agent._create_brand_voice_summary(state["brand_voice"]),
+                facts=self.text_generator._create_facts_summary(state["factual_grounding"]),
+                objective=objective or 'Crear contenido atractivo',
+                platform=platform,
+                visual_format=visual_format,
+                video_section=video_section.format(duration=duration) if include_video else "",
+                video_schema=FUSED_VIDEO_SCHEMA if include_video else ""
+            )
+
+            # 2. Llamar al LLM una sola vez
+            logger.info("Generando contenido fusionado con LLM")
+            response = await self.llm.generate_structured(
+                prompt=prompt,
+                expected_format="JSON con core_content, visual_concept y video_script",
+                system_prompt=shared_context_block(state)
+            )
+
+            # 3. Validar cada pieza con los mismos criterios que los agentes individuales
+            core_content = self.text_generator._clean_and_validate_content(response.get("core_content", ""))
+            if not core_content or len(core_content.strip()) < 50:
+                raise ValueError("Contenido generado demasiado corto o vacío")
+
+            visual_concept = self.visual_concept_agent._validate_and_enhance_visual_concept(
+                VisualConcept(**response["visual_concept"])
+            )
+
+            video_script = None
+            if include_video and isinstance(response.get("video_script"), dict):
+                video_script = self.video_scripter._validate_and_enhance_script(
+                    self.video_scripter._parse_video_script(response["video_script"]),
+                    platform
+                )
+
+            # 4. Actualizar estado
+            state["core_content"] = core_content
+            state["visual_concept"] = visual_concept
+            state["completed_steps"].extend(["text_generation", "visual_concept"])
+            if video_script is not None:
+                state["video_script"] = video_script
+                state["completed_steps"].append("video_script")
+            state["current_step"] = "caption_creation"
+
+            # 5. Log del proceso
+            generation_time = time.perf_counter() - start
+            logger.info("Contenido fusionado generado en %.2fs", generation_time)
+
+            # Registrar tiempo del agente
+            state["agent_timings"]["fused_content"] = generation_time
+
+        except Exception as e:
+            logger.warning("Generación fusionada no válida (%s), usando TextGenerator", e)
+            state["agent_timings"]["fused_content"] = time.perf_counter() - start
+            state = await self.text_generator.process(state)
+
+        return state
@@ -7,7 +7,7 @@ from typing import Dict, Any
 
 from src.models.content_brief import PostType
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +44,7 @@ class PostClassifier:
             language = language_config.get("language", "es")
             
             analysis_summary = self._create_analysis_summary(state["prompt_analysis"])
-            template = get_prompt_template(AGENT_TEMPLATES["post_classifier"], language)
-            prompt = template.format(analysis=analysis_summary)
+            prompt = render_prompt(AGENT_TEMPLATES["post_classifier"], language, analysis=analysis_summary)
             
             # 2. Llamar al LLM
             self.logger.info("Generando clasificación con LLM")
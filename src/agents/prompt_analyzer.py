@@ -8,7 +8,8 @@ from typing import Dict, Any
 
 from src.models.content_brief import PromptAnalysis
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.settings import gemini_service_tier
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,7 @@ class PromptAnalyzer:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
+        self.service_tier = gemini_service_tier("prompt_analyzer")
         self.logger = logging.getLogger(__name__)
     
     async def process(self, state) -> Dict[str, Any]:
@@ -40,8 +42,7 @@ class PromptAnalyzer:
             language_config = state.get("language_config", {})
             language = language_config.get("language", "es")
             
-            template = get_prompt_template(AGENT_TEMPLATES["prompt_analyzer"], language)
-            prompt = template.format(prompt=state["input_prompt"])
+            prompt = render_prompt(AGENT_TEMPLATES["prompt_analyzer"], language, prompt=state["input_prompt"])
             
             # 2. Llamar al LLM
             self.logger.info("Generando análisis estructurado")
@@ -49,7 +50,8 @@ class PromptAnalyzer:
                 prompt,
                 expected_format="JSON con análisis del prompt",
                 max_tokens=800,
-                temperature=0.3
+                temperature=0.3,
+                service_tier=self.service_tier
             )
             
             # Validar y normalizar la respuesta antes de crear el objeto
@@ -139,7 +141,8 @@ class PromptAnalyzer:
             
             response = await self.llm.generate_structured(
                 prompt=formatted_prompt,
-                expected_format="JSON con análisis del prompt"
+                expected_format="JSON con análisis del prompt",
+                service_tier=self.service_tier
             )
             
             return PromptAnalysis(**response)
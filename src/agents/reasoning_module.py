@@ -7,7 +7,8 @@ from typing import Dict, Any
 
 from src.models.content_brief import ReasoningModule
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.settings import gemini_service_tier
+from src.config.prompts import render_prompt, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,7 @@ class ReasoningModuleAgent:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
+        self.service_tier = gemini_service_tier("reasoning_module")
         self.logger = logging.getLogger(__name__)
     
     async def process(self, state) -> Dict[str, Any]:
@@ -49,8 +51,9 @@ class ReasoningModuleAgent:
             full_analysis = self._create_full_analysis_summary(state)
             final_brief_summary = self._create_final_brief_summary(state)
             
-            template = get_prompt_template(AGENT_TEMPLATES["reasoning_module"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["reasoning_module"],
+                language,
                 full_analysis=full_analysis,
                 final_brief=final_brief_summary
             )
@@ -59,7 +62,8 @@ class ReasoningModuleAgent:
             self.logger.info("Generando razonamiento estratégico con LLM")
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con razonamiento estratégico"
+                expected_format="JSON con razonamiento estratégico",
+                service_tier=self.service_tier
             )
             
             # 3. Parsear respuesta
@@ -272,7 +276,8 @@ class ReasoningModuleAgent:
             
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con razonamiento estratégico"
+                expected_format="JSON con razonamiento estratégico",
+                service_tier=self.service_tier
             )
             
             reasoning = ReasoningModule(**response)
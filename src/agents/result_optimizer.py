@@ -1,16 +1,229 @@
 """
 Result-Based Optimizer - Optimiza recomendaciones basado en datos de performance simulados
 """
+import asyncio
+import copy
+import functools
+import hashlib
+import json
 import logging
+import re
 import time
-from typing import Dict, Any
+from collections import OrderedDict
+from string import Template
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Tuple
 from src.tools.llm_client import LLMClient
 from src.tools.realtime_data_client import RealTimeDataClient
 from src.tools.marketing_rag_system import MarketingRAGSystem
 from src.config.prompts import RESULT_OPTIMIZER_TEMPLATE_ES, RESULT_OPTIMIZER_TEMPLATE_EN
-from src.config.settings import get_settings
+from src.config.settings import gemini_service_tier
+from src.graph.state import update_state_with_optimization
+
+logger = logging.getLogger(__name__)
+
+# Templates del optimizador por idioma
+_TEMPLATES_BY_LANG = {"en": RESULT_OPTIMIZER_TEMPLATE_EN, "es": RESULT_OPTIMIZER_TEMPLATE_ES}
+
+_DYNAMIC_FIELDS = ("{performance_data}", "{current_strategy}", "{optimization_opportunities}")
+
+def _split_template(template: str) -> Tuple[str, str]:
+    """
+    Separa un template en instrucciones estáticas y bloque de datos dinámico,
+    para enviar las instrucciones como prefijo idéntico en cada llamada
+    """
+    static_lines, dynamic_lines = [], []
+    for line in template.strip().splitlines():
+        if any(field in line for field in _DYNAMIC_FIELDS):
+            dynamic_lines.append(line)
+        else:
+            static_lines.append(line)
+    
+    instructions = re.sub(r"\n{3,}", "\n\n", "\n".join(static_lines)).format()
+    return instructions, "\n".join(dynamic_lines)
+
+# (instrucciones estáticas, bloque dinámico) por idioma
+_PROMPT_PARTS_BY_LANG = {lang: _split_template(template) for lang, template in _TEMPLATES_BY_LANG.items()}
+
+# Caché de insights RAG (los hashtags en tendencia caducan pronto)
+_RAG_CACHE_MAX_ENTRIES = 256
+_RAG_CACHE_TTL_SECONDS = 600
+
+# Campos (clave del estado, atributo, default) leídos por el optimizador
+_PROCESS_FIELDS = (
+    ("post_classification", "post_type", "promotional"),
+    ("prompt_analysis", "platform", "Instagram"),
+    ("visual_format_recommendation", "recommended_format", "Image"),
+)
+_STRATEGY_FIELDS = (
+    ("generated_content", "main_text", "N/A"),
+    ("caption_with_cta", "caption", "N/A"),
+    ("visual_concept", "concept_description", "N/A"),
+)
+
+def _ensure_timings(state) -> Dict[str, float]:
+    """Devuelve el diccionario de tiempos por agente del estado, creándolo si falta"""
+    if isinstance(state, dict):
+        return state.setdefault("agent_timings", {})
+    if getattr(state, "agent_timings", None) is None:
+        state.agent_timings = {}
+    return state.agent_timings
+
+def _ensure_errors(state) -> list:
+    """Devuelve la lista de errores del estado, creándola si falta"""
+    if isinstance(state, dict):
+        return state.setdefault("errors", [])
+    if getattr(state, "errors", None) is None:
+        state.errors = []
+    return state.errors
+
+def _unpack(state: Dict[str, Any], specs: Tuple[Tuple[str, str, Any], ...]) -> Tuple[Any, ...]:
+    """Lee campos de objetos del estado que pueden ser modelos o diccionarios"""
+    get = state.get
+    values = []
+    for key, attr, default in specs:
+        obj = get(key)
+        if obj is None:
+            values.append(default)
+        elif isinstance(obj, dict):
+            values.append(obj.get(attr, default))
+        else:
+            values.append(getattr(obj, attr, default))
+    return tuple(values)
+
+# Bloques de datos del prompt, compilados una sola vez
+_PERFORMANCE_TEMPLATE = Template(
+    "Data Source: $data_source\n"
+    "Post Type: $post_type\n"
+    "Platform: $platform\n"
+    "Visual Format: $visual_format\n"
+    "$insights"
+)
+_STRATEGY_TEMPLATE = Template(
+    "Generated Content: $main_text\n"
+    "Caption: $caption\n"
+    "Visual Concept: $concept"
+)
+
+# Límites del bloque de insights enviado al LLM
+_MAX_PROMPT_HASHTAGS = 5
+_HISTORICAL_PROMPT_FIELDS = frozenset({"ctr", "engagement", "average_reach", "source", "audience"})
+
+def _render_value(value: Any) -> str:
+    """Formatea un valor de forma determinista para el prompt"""
+    if isinstance(value, float):
+        return str(round(value, 3))
+    if isinstance(value, (dict, list, tuple)):
+        # Serialización compacta con claves ordenadas en lugar del repr de Python
+        return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return str(value)
+
+def _render_insights(insights: Dict[str, Any]) -> str:
+    """
+    Renderiza los insights con salida acotada y estable: claves ordenadas,
+    floats redondeados y listas truncadas, para que entradas equivalentes
+    produzcan exactamente el mismo texto
+    """
+    projected = insights.get("projected_metrics", {})
+    expected_engagement = insights.get("expected_engagement_rate", projected.get("expected_engagement_rate", 0.045))
+    historical = insights.get("historical_performance", {})
+    hashtags = insights.get("trending_hashtags", [])[:_MAX_PROMPT_HASHTAGS]
+    
+    historical_line = ", ".join(
+        f"{key}={_render_value(historical[key])}"
+        for key in sorted(historical) if key in _HISTORICAL_PROMPT_FIELDS
+    )
+    
+    return "\n".join((
+        f"Expected Engagement: {_render_value(expected_engagement)}",
+        f"Confidence Score: {_render_value(insights.get('confidence_score', 0.75))}",
+        f"Historical Performance: {historical_line}",
+        f"Trending Hashtags: {', '.join(hashtags)}",
+        f"RAG Enhanced: {bool(insights.get('rag_enabled', False))}"
+    ))
+
+# Palabras clave por industria, en orden de prioridad
+# Palabras clave en singular; los plurales se reconocen quitando "s"/"es" al token
+_INDUSTRY_KEYWORDS = (
+    ("fitness", frozenset({"fitness", "gym", "health", "wellness", "workout",
+                           "gimnasio", "salud", "bienestar", "entrenamiento", "clínica"})),
+    ("fashion", frozenset({"fashion", "clothing", "style", "apparel", "moda", "ropa", "estilo"})),
+    ("tech", frozenset({"tech", "app", "software", "digital", "technology", "tecnología"})),
+    ("food", frozenset({"food", "restaurant", "recipe", "cooking",
+                        "comida", "restaurante", "receta", "cocina"})),
+    ("beauty", frozenset({"beauty", "cosmetics", "skincare", "belleza", "cosmética", "maquillaje"})),
+)
+
+# \w incluye letras acentuadas ("clínicas", "tecnología")
+_WORD_RE = re.compile(r"\w+")
+
+# Base de datos simulada de performance (fallback)
+_PERFORMANCE_DB = MappingProxyType({
+    "post_types": {
+        "Launch": {"avg_engagement": 0.045, "conversion_rate": 0.032},
+        "Promotional": {"avg_engagement": 0.038, "conversion_rate": 0.028},
+        "Educational": {"avg_engagement": 0.052, "conversion_rate": 0.019},
+        "Testimonial": {"avg_engagement": 0.041, "conversion_rate": 0.035}
+    },
+    "visual_formats": {
+        "Image": {"engagement_boost": 1.0, "production_cost": "low"},
+        "Video": {"engagement_boost": 1.8, "production_cost": "high"},
+        "Carousel": {"engagement_boost": 1.4, "production_cost": "medium"},
+        "Infographic": {"engagement_boost": 1.2, "production_cost": "medium"}
+    },
+    "platforms": {
+        "LinkedIn": {"business_conversion": 0.045, "peak_hours": "9-11 AM"},
+        "Instagram": {"engagement_rate": 0.058, "peak_hours": "6-9 PM"},
+        "TikTok": {"viral_potential": 0.012, "peak_hours": "7-9 PM"},
+        "Twitter": {"reach_multiplier": 1.3, "peak_hours": "12-3 PM"}
+    }
+})
+
+# Multiplicador de engagement por formato visual
+_FORMAT_BOOST = MappingProxyType({"Video": 1.8, "Carousel": 1.4, "Image": 1.0, "Infographic": 1.2})
+
+# Métricas históricas simuladas por tipo de post y formato
+_HISTORICAL_DATA = MappingProxyType({
+    "promotional": {
+        "Image": {"ctr": 0.029, "engagement": 0.035, "reach": 1200, "conversions": 0.024},
+        "Video": {"ctr": 0.045, "engagement": 0.063, "reach": 2100, "conversions": 0.038},
+        "Carousel": {"ctr": 0.037, "engagement": 0.042, "reach": 1650, "conversions": 0.031}
+    },
+    "educational": {
+        "Image": {"ctr": 0.032, "engagement": 0.042, "reach": 1400, "conversions": 0.019},
+        "Video": {"ctr": 0.051, "engagement": 0.076, "reach": 2400, "conversions": 0.029},
+        "Carousel": {"ctr": 0.041, "engagement": 0.051, "reach": 1800, "conversions": 0.023}
+    },
+    "entertainment": {
+        "Image": {"ctr": 0.038, "engagement": 0.048, "reach": 1600, "conversions": 0.015},
+        "Video": {"ctr": 0.067, "engagement": 0.086, "reach": 3200, "conversions": 0.022},
+        "Carousel": {"ctr": 0.044, "engagement": 0.058, "reach": 2000, "conversions": 0.018}
+    }
+})
+
+_PLATFORM_PERFORMANCE = MappingProxyType({
+    "Instagram": {"reach_multiplier": 1.0, "engagement_boost": 1.0, "peak_hours": "7-9 PM"},
+    "TikTok": {"reach_multiplier": 1.4, "engagement_boost": 1.3, "peak_hours": "6-10 PM"},
+    "Facebook": {"reach_multiplier": 0.8, "engagement_boost": 0.8, "peak_hours": "1-3 PM"},
+    "LinkedIn": {"reach_multiplier": 0.6, "engagement_boost": 0.6, "peak_hours": "8-10 AM"},
+    "Twitter": {"reach_multiplier": 0.9, "engagement_boost": 0.9, "peak_hours": "9 AM-12 PM"}
+})
+
+# (formato, engagement, ctr) precalculados por tipo de post para las comparaciones
+_FORMAT_METRICS = MappingProxyType({
+    post_key: tuple((fmt, data["engagement"], data["ctr"]) for fmt, data in formats.items())
+    for post_key, formats in _HISTORICAL_DATA.items()
+})
+
+@functools.lru_cache(maxsize=1)
+def _cached_rag_deps() -> MappingProxyType:
+    """Comprueba una sola vez por proceso las dependencias RAG disponibles"""
+    try:
+        from src.tools.marketing_rag_system import check_rag_dependencies
+        return MappingProxyType(check_rag_dependencies())
+    except ImportError:
+        return MappingProxyType({"chromadb": False, "sentence_transformers": False, "duckduckgo_search": False})
 
-logger = get_settings().getLogger(__name__)
 
 class ResultOptimizer:
     """
@@ -19,6 +232,7 @@ class ResultOptimizer:
     
     def __init__(self, llm_client: LLMClient, use_realtime_data: bool = False, enable_rag: bool = True):
         self.llm = llm_client
+        self.service_tier = gemini_service_tier("result_optimizer")
         self.logger = logging.getLogger(__name__)
         self.use_realtime_data = use_realtime_data
         self.enable_rag = enable_rag
@@ -26,17 +240,18 @@ class ResultOptimizer:
         
         # Inicializar sistema RAG
         self.rag_system = MarketingRAGSystem(enable_rag=enable_rag)
-        try:
-            from src.tools.marketing_rag_system import check_rag_dependencies
-            self.rag_dependencies = check_rag_dependencies()
-        except ImportError:
-            self.rag_dependencies = {"chromadb": False, "sentence_transformers": False, "duckduckgo_search": False}
+        self._rag_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.rag_dependencies = dict(_cached_rag_deps())
         
         # Base de datos de performance (fallback)
         self.performance_db = self._initialize_performance_db()
         
+        # Estado de dependencias, descripción y fuente de insights
+        self._refresh_data_source()
+        self._insight_strategy = self._select_insight_strategy()
+        
         # Log del estado del sistema
-        if enable_rag and all(self.rag_dependencies.values()):
+        if self._rag_fully_ready:
             self.logger.info("RAG system fully enabled with all dependencies")
         elif enable_rag:
             missing = [k for k, v in self.rag_dependencies.items() if not v]
@@ -44,28 +259,23 @@ class ResultOptimizer:
         else:
             self.logger.info("RAG system disabled, using traditional approach")
     
+    def _refresh_data_source(self) -> None:
+        """Recalcula el estado RAG y la descripción de la fuente de datos"""
+        self._rag_fully_ready = self.enable_rag and all(self.rag_dependencies.values())
+        
+        if self._rag_fully_ready:
+            self._data_source_description = "RAG System with Real Marketing Benchmarks"
+        elif self.enable_rag:
+            missing = [k for k, v in self.rag_dependencies.items() if not v]
+            self._data_source_description = f"RAG System (Partial - Missing: {', '.join(missing)})"
+        elif self.use_realtime_data:
+            self._data_source_description = "Real-time API Data"
+        else:
+            self._data_source_description = "Enhanced Historical Simulated Data"
+    
     def _initialize_performance_db(self) -> Dict[str, Any]:
         """Inicializa base de datos simulada de performance"""
-        return {
-            "post_types": {
-                "Launch": {"avg_engagement": 0.045, "conversion_rate": 0.032},
-                "Promotional": {"avg_engagement": 0.038, "conversion_rate": 0.028},
-                "Educational": {"avg_engagement": 0.052, "conversion_rate": 0.019},
-                "Testimonial": {"avg_engagement": 0.041, "conversion_rate": 0.035}
-            },
-            "visual_formats": {
-                "Image": {"engagement_boost": 1.0, "production_cost": "low"},
-                "Video": {"engagement_boost": 1.8, "production_cost": "high"},
-                "Carousel": {"engagement_boost": 1.4, "production_cost": "medium"},
-                "Infographic": {"engagement_boost": 1.2, "production_cost": "medium"}
-            },
-            "platforms": {
-                "LinkedIn": {"business_conversion": 0.045, "peak_hours": "9-11 AM"},
-                "Instagram": {"engagement_rate": 0.058, "peak_hours": "6-9 PM"},
-                "TikTok": {"viral_potential": 0.012, "peak_hours": "7-9 PM"},
-                "Twitter": {"reach_multiplier": 1.3, "peak_hours": "12-3 PM"}
-            }
-        }
+        return _PERFORMANCE_DB
     
     async def process(self, state) -> Dict[str, Any]:
         """
@@ -78,66 +288,55 @@ class ResultOptimizer:
             Estado actualizado con optimizaciones
         """
         start_time = time.time()
+        timings = _ensure_timings(state)
+        record_error = _ensure_errors(state).append
         try:
             self.logger.info("Iniciando optimización basada en resultados")
             
             # Obtener datos necesarios del estado
-            post_type = getattr(state.get("post_classification", {}), 'post_type', 'promotional')
-            platform = getattr(state.get("prompt_analysis", {}), 'platform', 'Instagram')
-            visual_format = getattr(state.get("visual_format_recommendation", {}), 'recommended_format', 'Image')
+            post_type, platform, visual_format = _unpack(state, _PROCESS_FIELDS)
             
             # Determinar industria del prompt para datos específicos
             industry = self._extract_industry_from_prompt(state.get("input_prompt", ""))
             
-            # Generar insights de performance usando la mejor fuente disponible
-            if self.enable_rag:
-                insights = await self._get_rag_enhanced_insights(industry, platform, visual_format, post_type, state.get("input_prompt", ""))
-            elif self.use_realtime_data:
-                insights = await self._get_realtime_performance_insights(industry, platform, visual_format, post_type)
-            else:
-                insights = self._generate_performance_insights(post_type, platform, visual_format)
+            # Generar insights de performance y resumir la estrategia actual
+            insights = await self._insight_strategy(industry, platform, visual_format, post_type, state.get("input_prompt", ""))
+            current_strategy = self._summarize_generated_content(state)
             
             # Crear recomendaciones de optimización
             recommendations = self._create_optimization_recommendations(state, insights)
             
             # Detectar idioma
-            detected_language = state.get("detected_language", "es")
+            language_config = state.get("language_config") or {}
+            detected_language = language_config.get("language", state.get("detected_language", "es"))
             
             # Preparar datos para el prompt con información de fuente
             data_source = self._get_data_source_description()
-            performance_data = f"""
-            Data Source: {data_source}
-            Post Type: {post_type}
-            Platform: {platform}
-            Visual Format: {visual_format}
-            Expected Engagement: {insights.get('expected_engagement_rate', insights.get('projected_metrics', {}).get('expected_engagement_rate', 0.045))}
-            Confidence Score: {insights.get('confidence_score', 0.75)}
-            Historical Performance: {insights.get('historical_performance', {})}
-            Trending Hashtags: {insights.get('trending_hashtags', [])}
-            RAG Enhanced: {insights.get('rag_enabled', False)}
-            """
-            
-            current_strategy = f"""
-            Generated Content: {getattr(state.get('generated_content', {}), 'main_text', 'N/A')}
-            Caption: {getattr(state.get('caption_with_cta', {}), 'caption', 'N/A')}
-            Visual Concept: {getattr(state.get('visual_concept', {}), 'concept_description', 'N/A')}
-            """
+            performance_data = _PERFORMANCE_TEMPLATE.substitute(
+                data_source=data_source,
+                post_type=post_type,
+                platform=platform,
+                visual_format=visual_format,
+                insights=_render_insights(insights)
+            )
             
             optimization_opportunities = "\n".join(recommendations)
             
             # Seleccionar template según idioma
-            template = RESULT_OPTIMIZER_TEMPLATE_EN if is_english else RESULT_OPTIMIZER_TEMPLATE_ES
+            instructions, data_template = _PROMPT_PARTS_BY_LANG.get(detected_language, _PROMPT_PARTS_BY_LANG["es"])
             
-            prompt = template.format(
+            prompt = data_template.format(
                 performance_data=performance_data,
                 current_strategy=current_strategy,
                 optimization_opportunities=optimization_opportunities
             )
             
-            # Generar optimizaciones
+            # Generar optimizaciones (instrucciones estáticas primero, datos al final)
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con optimizaciones"
+                expected_format="JSON con optimizaciones",
+                system_prompt=instructions,
+                service_tier=self.service_tier
             )
             
             # Actualizar estado
@@ -158,112 +357,141 @@ class ResultOptimizer:
             self.logger.info(f"Optimización completada en {processing_time:.2f}s")
             
             # Registrar tiempo del agente
-            if isinstance(state, dict):
-                if "agent_timings" not in state:
-                    state["agent_timings"] = {}
-                state["agent_timings"]["result_optimizer"] = processing_time
-            else:
-                if not hasattr(state, 'agent_timings'):
-                    state.agent_timings = {}
-                state.agent_timings["result_optimizer"] = processing_time
+            timings["result_optimizer"] = processing_time
             
             return state
             
         except Exception as e:
             error_msg = f"Error en Result Optimizer: {str(e)}"
             self.logger.error(error_msg)
-            state["errors"].append(error_msg)
+            record_error(error_msg)
             return state
     
+    def _update_result_optimization_state(self, state, optimization: Dict[str, Any]):
+        """Actualiza el estado con las optimizaciones basadas en resultados"""
+        if not isinstance(state, dict):
+            return update_state_with_optimization(state, optimization)
+        
+        state["result_optimizations"] = optimization
+        state.setdefault("completed_steps", []).append("result_optimization")
+        state["current_step"] = "contextual_awareness"
+        return state
+    
+    def _select_insight_strategy(self):
+        """Elige una vez la fuente de insights según la configuración del agente"""
+        if self.enable_rag:
+            return self._get_rag_enhanced_insights
+        elif self.use_realtime_data:
+            return self._get_realtime_performance_insights
+        return self._get_static_performance_insights
+    
+    async def _get_static_performance_insights(self, industry: str, platform: str, visual_format: str, post_type: str, prompt: str = "") -> Dict[str, Any]:
+        """Genera insights con datos históricos simulados (cálculo en memoria, sin hilo aparte)"""
+        return self._generate_performance_insights(post_type, platform, visual_format)
+    
+    def _summarize_generated_content(self, state: Dict[str, Any]) -> str:
+        """Resume el contenido ya generado para el prompt de optimización"""
+        main_text, caption, concept = _unpack(state, _STRATEGY_FIELDS)
+        return _STRATEGY_TEMPLATE.substitute(main_text=main_text, caption=caption, concept=concept)
+    
     def _extract_industry_from_prompt(self, prompt: str) -> str:
         """Extrae la industria del prompt para datos específicos"""
-        prompt_lower = prompt.lower()
+        tokens = set()
+        for word in _WORD_RE.findall(prompt.lower()):
+            tokens.add(word)
+            # Formas en singular: "apps" -> "app", "restaurantes" -> "restaurante"/"restaurant"
+            if word.endswith("s"):
+                tokens.add(word[:-1])
+                if word.endswith("es"):
+                    tokens.add(word[:-2])
         
-        if any(word in prompt_lower for word in ["fitness", "gym", "health", "wellness", "workout"]):
-            return "fitness"
-        elif any(word in prompt_lower for word in ["fashion", "clothing", "style", "apparel"]):
-            return "fashion"
-        elif any(word in prompt_lower for word in ["tech", "app", "software", "digital", "technology"]):
-            return "tech"
-        elif any(word in prompt_lower for word in ["food", "restaurant", "recipe", "cooking"]):
-            return "food"
-        elif any(word in prompt_lower for word in ["beauty", "cosmetics", "skincare"]):
-            return "beauty"
-        else:
-            return "general"
+        for industry, keywords in _INDUSTRY_KEYWORDS:
+            if tokens & keywords:
+                return industry
+        return "general"
     
-    async def _get_realtime_performance_insights(self, industry: str, platform: str, visual_format: str, post_type: str) -> Dict[str, Any]:
+    async def _get_realtime_performance_insights(self, industry: str, platform: str, visual_format: str, post_type: str, prompt: str = "") -> Dict[str, Any]:
         """Obtiene insights de performance usando datos en tiempo real"""
         try:
-            if not self.realtime_client:
-                self.realtime_client = RealTimeDataClient()
+            client = await self._get_realtime_client()
+            
+            # Obtener datos de mercado en tiempo real
+            market_data = await client.get_real_time_marketing_data(
+                industry=industry,
+                platform=platform,
+                campaign_type=post_type
+            )
+            
+            # Convertir a formato compatible con el sistema existente
+            base_engagement = market_data.engagement_rates.get(visual_format, 0.045)
+            platform_data = market_data.platform_metrics.get(platform, {})
+            
+            # Calcular format_boost basado en el formato visual
+            format_boost = _FORMAT_BOOST.get(visual_format, 1.0)
+            
+            return {
+                "historical_performance": {
+                    "ctr": base_engagement * 0.7,  # CTR típicamente menor que engagement
+                    "engagement": base_engagement,
+                    "average_reach": int(base_engagement * 50000)  # Estimación basada en engagement
+                },
+                "projected_metrics": {
+                    "expected_ctr": round(base_engagement * 0.8, 3),
+                    "expected_engagement_rate": round(base_engagement, 3),
+                    "estimated_reach": int(base_engagement * 60000)
+                },
+                "trending_hashtags": market_data.trending_hashtags[:5],
+                "platform_insights": {
+                    "optimal_posting_time": platform_data.get("peak_hours", "7-9 PM"),
+                    "platform_boost": platform_data.get("engagement_boost", 1.0),
+                    "reach_potential": platform_data.get("reach_multiplier", 1.0)
+                },
+                "seasonal_trends": market_data.seasonal_trends,
+                "competitive_insights": market_data.competitive_insights,
+                "confidence_score": 0.85,  # Mayor confianza con datos reales
+                "data_timestamp": market_data.timestamp.isoformat(),
+                "data_source": "real_time",
+                "format_boost": format_boost
+            }
             
-            async with self.realtime_client as client:
-                # Obtener datos de mercado en tiempo real
-                market_data = await client.get_real_time_marketing_data(
-                    industry=industry,
-                    platform=platform,
-                    campaign_type=post_type
-                )
-                
-                # Convertir a formato compatible con el sistema existente
-                base_engagement = market_data.engagement_rates.get(visual_format, 0.045)
-                platform_data = market_data.platform_metrics.get(platform, {})
-                
-                # Calcular format_boost basado en el formato visual
-                format_boost = 1.0
-                if visual_format == "Video":
-                    format_boost = 1.8
-                elif visual_format == "Carousel":
-                    format_boost = 1.4
-                
-                return {
-                    "historical_performance": {
-                        "ctr": base_engagement * 0.7,  # CTR típicamente menor que engagement
-                        "engagement": base_engagement,
-                        "average_reach": int(base_engagement * 50000)  # Estimación basada en engagement
-                    },
-                    "projected_metrics": {
-                        "expected_ctr": round(base_engagement * 0.8, 3),
-                        "expected_engagement_rate": round(base_engagement, 3),
-                        "estimated_reach": int(base_engagement * 60000)
-                    },
-                    "trending_hashtags": market_data.trending_hashtags[:5],
-                    "platform_insights": {
-                        "optimal_posting_time": platform_data.get("peak_hours", "7-9 PM"),
-                        "platform_boost": platform_data.get("engagement_boost", 1.0),
-                        "reach_potential": platform_data.get("reach_multiplier", 1.0)
-                    },
-                    "seasonal_trends": market_data.seasonal_trends,
-                    "competitive_insights": market_data.competitive_insights,
-                    "confidence_score": 0.85,  # Mayor confianza con datos reales
-                    "data_timestamp": market_data.timestamp.isoformat(),
-                    "data_source": "real_time",
-                    "format_boost": format_boost
-                }
-                
         except Exception as e:
             self.logger.warning(f"Error obteniendo datos en tiempo real, usando simulados: {e}")
             # Fallback a datos simulados
             return self._generate_performance_insights(post_type, platform, visual_format)
     
+    async def _get_realtime_client(self) -> RealTimeDataClient:
+        """Obtiene el cliente de datos en tiempo real, abriendo su sesión HTTP una sola vez"""
+        if self.realtime_client is None:
+            client = RealTimeDataClient()
+            await client.__aenter__()
+            self.realtime_client = client
+        return self.realtime_client
+    
+    async def aclose(self) -> None:
+        """Cierra la sesión HTTP del cliente de datos en tiempo real"""
+        if self.realtime_client is not None:
+            await self.realtime_client.__aexit__(None, None, None)
+            self.realtime_client = None
+    
     def _get_data_source_description(self) -> str:
         """Obtiene descripción de la fuente de datos activa"""
-        if self.enable_rag and all(self.rag_dependencies.values()):
-            return "RAG System with Real Marketing Benchmarks"
-        elif self.enable_rag:
-            missing = [k for k, v in self.rag_dependencies.items() if not v]
-            return f"RAG System (Partial - Missing: {', '.join(missing)})"
-        elif self.use_realtime_data:
-            return "Real-time API Data"
-        else:
-            return "Enhanced Historical Simulated Data"
+        return self._data_source_description
     
     async def _get_rag_enhanced_insights(self, industry: str, platform: str, visual_format: str, post_type: str, prompt: str) -> Dict[str, Any]:
         """Obtiene insights mejorados usando el sistema RAG"""
+        cache_key = (
+            industry, platform, visual_format, post_type,
+            hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        )
+        cached = self._get_cached_rag_insights(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             # Usar el sistema RAG para obtener recomendación completa
-            rag_recommendation = self.rag_system.generate_enhanced_recommendation(
+            # La búsqueda RAG es síncrona; se ejecuta en un hilo para no bloquear el event loop
+            rag_recommendation = await asyncio.to_thread(
+                self.rag_system.generate_enhanced_recommendation,
                 prompt=prompt,
                 platform=platform,
                 industry=industry,
@@ -280,13 +508,9 @@ class ResultOptimizer:
             expected_performance = rag_recommendation.get('expected_performance', {})
             
             # Calcular format_boost basado en el formato visual
-            format_boost = 1.0
-            if visual_format == "Video":
-                format_boost = 1.8
-            elif visual_format == "Carousel":
-                format_boost = 1.4
+            format_boost = _FORMAT_BOOST.get(visual_format, 1.0)
             
-            return {
+            insights = {
                 "historical_performance": {
                     "source": historical_justification.get('source', 'RAG System'),
                     "context": historical_justification.get('context', ''),
@@ -306,68 +530,63 @@ class ResultOptimizer:
                 "data_freshness": rag_recommendation.get('data_freshness', ''),
                 "format_boost": format_boost
             }
+            self._store_rag_insights(cache_key, insights)
+            return insights
             
         except Exception as e:
             self.logger.error(f"Error en sistema RAG: {e}")
             # Fallback a método tradicional
             return self._generate_performance_insights(post_type, platform, visual_format)
     
-    def _generate_performance_insights(self, post_type: str, platform: str, visual_format: str) -> Dict[str, Any]:
-        """Genera insights de performance basados en datos históricos simulados"""
-        # Base de datos simulada con métricas históricas más detalladas
-        historical_data = {
-            "promotional": {
-                "Image": {"ctr": 0.029, "engagement": 0.035, "reach": 1200, "conversions": 0.024},
-                "Video": {"ctr": 0.045, "engagement": 0.063, "reach": 2100, "conversions": 0.038},
-                "Carousel": {"ctr": 0.037, "engagement": 0.042, "reach": 1650, "conversions": 0.031}
-            },
-            "educational": {
-                "Image": {"ctr": 0.032, "engagement": 0.042, "reach": 1400, "conversions": 0.019},
-                "Video": {"ctr": 0.051, "engagement": 0.076, "reach": 2400, "conversions": 0.029},
-                "Carousel": {"ctr": 0.041, "engagement": 0.051, "reach": 1800, "conversions": 0.023}
-            },
-            "entertainment": {
-                "Image": {"ctr": 0.038, "engagement": 0.048, "reach": 1600, "conversions": 0.015},
-                "Video": {"ctr": 0.067, "engagement": 0.086, "reach": 3200, "conversions": 0.022},
-                "Carousel": {"ctr": 0.044, "engagement": 0.058, "reach": 2000, "conversions": 0.018}
-            }
-        }
+    def _get_cached_rag_insights(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Devuelve una copia profunda de los insights RAG cacheados si no han expirado"""
+        entry = self._rag_cache.get(key)
+        if entry is None:
+            return None
         
-        platform_performance = {
-            "Instagram": {"reach_multiplier": 1.0, "engagement_boost": 1.0, "peak_hours": "7-9 PM"},
-            "TikTok": {"reach_multiplier": 1.4, "engagement_boost": 1.3, "peak_hours": "6-10 PM"},
-            "Facebook": {"reach_multiplier": 0.8, "engagement_boost": 0.8, "peak_hours": "1-3 PM"},
-            "LinkedIn": {"reach_multiplier": 0.6, "engagement_boost": 0.6, "peak_hours": "8-10 AM"},
-            "Twitter": {"reach_multiplier": 0.9, "engagement_boost": 0.9, "peak_hours": "9 AM-12 PM"}
-        }
+        stored_at, insights = entry
+        if time.monotonic() - stored_at > _RAG_CACHE_TTL_SECONDS:
+            del self._rag_cache[key]
+            return None
         
+        self._rag_cache.move_to_end(key)
+        return copy.deepcopy(insights)
+    
+    def _store_rag_insights(self, key: tuple, insights: Dict[str, Any]) -> None:
+        """Guarda una copia profunda de los insights RAG en la caché LRU"""
+        self._rag_cache[key] = (time.monotonic(), copy.deepcopy(insights))
+        self._rag_cache.move_to_end(key)
+        if len(self._rag_cache) > _RAG_CACHE_MAX_ENTRIES:
+            self._rag_cache.popitem(last=False)
+    
+    def _generate_performance_insights(self, post_type: str, platform: str, visual_format: str) -> Dict[str, Any]:
+        """Genera insights de performance basados en datos históricos simulados"""
         # Obtener datos históricos
-        post_data = historical_data.get(post_type.lower(), historical_data["promotional"])
+        post_key = post_type.lower()
+        if post_key not in _HISTORICAL_DATA:
+            post_key = "promotional"
+        post_data = _HISTORICAL_DATA[post_key]
         format_data = post_data.get(visual_format, post_data["Image"])
-        platform_data = platform_performance.get(platform, platform_performance["Instagram"])
+        platform_data = _PLATFORM_PERFORMANCE.get(platform, _PLATFORM_PERFORMANCE["Instagram"])
+        engagement_boost = platform_data["engagement_boost"]
         
         # Calcular métricas proyectadas
-        projected_ctr = format_data["ctr"] * platform_data["engagement_boost"]
-        projected_engagement = format_data["engagement"] * platform_data["engagement_boost"]
+        projected_ctr = format_data["ctr"] * engagement_boost
+        projected_engagement = format_data["engagement"] * engagement_boost
         projected_reach = int(format_data["reach"] * platform_data["reach_multiplier"])
         
         # Calcular comparaciones con otros formatos
-        format_comparison = {}
-        for fmt, data in post_data.items():
-            if fmt != visual_format:
-                comparison_engagement = data["engagement"] * platform_data["engagement_boost"]
-                improvement = ((projected_engagement - comparison_engagement) / comparison_engagement) * 100
-                format_comparison[fmt] = {
-                    "engagement_diff": round(improvement, 1),
-                    "historical_ctr": data["ctr"]
-                }
+        format_comparison = {
+            fmt: {
+                "engagement_diff": round((projected_engagement - engagement * engagement_boost) / (engagement * engagement_boost) * 100, 1),
+                "historical_ctr": ctr
+            }
+            for fmt, engagement, ctr in _FORMAT_METRICS[post_key]
+            if fmt != visual_format
+        }
         
         # Calcular format_boost basado en el formato visual
-        format_boost = 1.0
-        if visual_format == "Video":
-            format_boost = 1.8
-        elif visual_format == "Carousel":
-            format_boost = 1.4
+        format_boost = _FORMAT_BOOST.get(visual_format, 1.0)
         
         return {
             "historical_performance": {
@@ -396,28 +615,34 @@ class ResultOptimizer:
         recommendations = []
         
         # Optimización de timing
-        platform = getattr(state["prompt_analysis"], 'platform', 'general')
+        platform, = _unpack(state, (("prompt_analysis", "platform", "general"),))
         if platform in self.performance_db["platforms"]:
             peak_hours = self.performance_db["platforms"][platform].get("peak_hours")
             recommendations.append(f"Publicar durante horas pico: {peak_hours}")
         
         # Optimización de formato
-        language = state.get("language_config", {}).get("language", "es")
-        if insights["format_boost"] < 1.5:
+        language = (state.get("language_config") or {}).get("language", "es")
+        expected_engagement = insights.get(
+            "expected_engagement_rate",
+            insights.get("projected_metrics", {}).get("expected_engagement_rate", 0.045)
+        )
+        conversion_potential = insights.get("conversion_potential", round(expected_engagement * 0.7, 3))
+        
+        if insights.get("format_boost", 1.0) < 1.5:
             if language == "en":
                 recommendations.append("Consider video format for higher engagement")
             else:
                 recommendations.append("Considerar formato de video para mayor engagement")
         
         # Optimización de contenido
-        if insights["expected_engagement_rate"] < 0.04:
+        if expected_engagement < 0.04:
             if language == "en":
                 recommendations.append("Add more interactive or engaging elements")
             else:
                 recommendations.append("Agregar elementos más interactivos o controversiales")
         
         # Optimización de CTA
-        if insights["conversion_potential"] < 0.03:
+        if conversion_potential < 0.03:
             if language == "en":
                 recommendations.append("Strengthen call-to-action with urgency or incentives")
             else:
@@ -449,13 +674,8 @@ class ResultOptimizer:
         
         # Aplicar boosts por optimizaciones
         optimization_boost = len(optimizations.get("content_optimizations", [])) * 0.005
-        format_boost = 1.0
-        
         visual_format = state.get("visual_format_recommendation", {}).get("recommended_format", "Image")
-        if visual_format == "Video":
-            format_boost = 1.8
-        elif visual_format == "Carousel":
-            format_boost = 1.4
+        format_boost = _FORMAT_BOOST.get(visual_format, 1.0)
         
         predicted_engagement = base_engagement * format_boost + optimization_boost
         
@@ -1,15 +1,63 @@
 """
 Agente Text Generator - Genera contenido principal coherente del post
 """
+import functools
 import logging
+import re
 import time
 from typing import Dict, Any
 from src.models.content_brief import ContentBrief
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import render_prompt, shared_context_block, AGENT_TEMPLATES
+from src.graph.state import state_field
 
 logger = logging.getLogger(__name__)
 
+# Patrones de limpieza del contenido generado
+_FORMAT_MARKERS = re.compile(r'```|\*\*|\*')
+# Números/guiones al inicio o líneas vacías múltiples, en una sola pasada
+_LAYOUT_JUNK = re.compile(r'(?P<leading>\A[\d\-\.\s]+)|\n\s*\n')
+
+def _replace_layout_junk(match: re.Match) -> str:
+    """Elimina el prefijo inicial y colapsa las líneas vacías múltiples"""
+    return "" if match.lastgroup == "leading" else "\n\n"
+
+@functools.lru_cache(maxsize=1024)
+def _analysis_summary(objective, audience, content_goals: tuple) -> str:
+    """Resumen del análisis a partir de sus campos (memoizado)"""
+    if objective and audience and content_goals:
+        return f"OBJETIVO: {objective}\nAUDIENCIA: {audience}\nMETAS: {', '.join(content_goals)}"
+    
+    summary = (
+        (f"OBJETIVO: {objective}\n" if objective else "")
+        + (f"AUDIENCIA: {audience}\n" if audience else "")
+        + (f"METAS: {', '.join(content_goals)}\n" if content_goals else "")
+    )
+    # Quitar solo el separador final añadido
+    return summary[:-1]
+
+@functools.lru_cache(maxsize=1024)
+def _brand_voice_summary(tone, personality, style, language_level) -> str:
+    """Resumen de la voz de marca a partir de sus campos (memoizado)"""
+    if tone and personality and style and language_level:
+        return f"TONO: {tone}\nPERSONALIDAD: {personality}\nESTILO: {style}\nNIVEL DE LENGUAJE: {language_level}"
+    
+    summary = (
+        (f"TONO: {tone}\n" if tone else "")
+        + (f"PERSONALIDAD: {personality}\n" if personality else "")
+        + (f"ESTILO: {style}\n" if style else "")
+        + (f"NIVEL DE LENGUAJE: {language_level}\n" if language_level else "")
+    )
+    # Quitar solo el separador final añadido
+    return summary[:-1]
+
+@functools.lru_cache(maxsize=1024)
+def _facts_summary(key_facts: tuple) -> str:
+    """Resumen de los hechos clave (memoizado)"""
+    if key_facts:
+        return f"HECHOS CLAVE: {', '.join(key_facts)}"
+    return "HECHOS: Información del prompt analizada"
+
 class TextGenerator:
     """
     Agente que genera el contenido principal coherente del post de marketing
@@ -17,7 +65,6 @@ class TextGenerator:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
-        self.logger = logging.getLogger(__name__)
     
     async def process(self, state) -> Dict[str, Any]:
         """
@@ -29,10 +76,10 @@ class TextGenerator:
         Returns:
             Estado actualizado con el contenido principal
         """
-        start_time = time.time()
+        start = time.perf_counter()
         
         try:
-            self.logger.info("Iniciando generación de contenido principal")
+            logger.info("Iniciando generación de contenido principal")
             
             # Verificar que tenemos todos los elementos necesarios
             required_elements = ["prompt_analysis", "post_type", "brand_voice", "factual_grounding"]
@@ -49,24 +96,25 @@ class TextGenerator:
             brand_voice_summary = self._create_brand_voice_summary(state["brand_voice"])
             facts_summary = self._create_facts_summary(state["factual_grounding"])
             
-            template = get_prompt_template(AGENT_TEMPLATES["text_generator"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["text_generator"],
+                language,
                 analysis=analysis_summary,
                 post_type=post_type,
                 brand_voice=brand_voice_summary,
                 facts=facts_summary
             )
             
-            # 2. Llamar al LLM
-            self.logger.info("Generando contenido principal con LLM")
-            response = await self.llm.generate(prompt)
+            # 2. Llamar al LLM (la limpieza necesita el texto completo, así que no se usa streaming)
+            logger.info("Generando contenido principal con LLM")
+            response = await self.llm.generate(prompt, system_prompt=shared_context_block(state))
             
             # 3. Limpiar y validar respuesta
-            self.logger.info("Limpiando y validando contenido generado")
+            logger.debug("Limpiando y validando contenido generado")
             core_content = self._clean_and_validate_content(response.content)
             
             # 4. Validar output
-            self.logger.info("Validando contenido generado")
+            logger.debug("Validando contenido generado")
             if not core_content or len(core_content.strip()) < 50:
                 raise ValueError("Contenido generado demasiado corto o vacío")
             
@@ -76,94 +124,45 @@ class TextGenerator:
             state["completed_steps"].append("text_generation")
             
             # 6. Log del proceso
-            generation_time = time.time() - start_time
-            self.logger.info(f"Contenido principal generado en {generation_time:.2f}s")
-            self.logger.info(f"Longitud del contenido: {len(core_content)} caracteres")
-            
-            # Registrar tiempo del agente
-            state["agent_timings"]["text_generator"] = generation_time
+            logger.info("Longitud del contenido: %d caracteres", len(core_content))
             
         except Exception as e:
-            generation_time = time.time() - start_time
             error_msg = f"Error en TextGenerator: {str(e)}"
-            self.logger.error(error_msg)
+            logger.error(error_msg)
             
             # Actualizar estado con error
             state["errors"].append(f"[text_generator]: {error_msg}")
             state["current_step"] = "error"
             state["is_error"] = True
-            
-            # Registrar tiempo del agente
+        
+        finally:
+            # Registrar tiempo del agente (un único cálculo para éxito y error)
+            generation_time = time.perf_counter() - start
             state["agent_timings"]["text_generator"] = generation_time
+            logger.info("TextGenerator finalizado en %.2fs", generation_time)
         
         return state
     
     def _create_analysis_summary(self, analysis) -> str:
-        """Crea resumen del análisis para el prompt"""
-        summary_parts = []
-        
-        # Manejar tanto dict como objeto PromptAnalysis
-        if hasattr(analysis, 'objective'):
-            objective = analysis.objective
-            audience = analysis.audience
-            content_goals = analysis.content_goals
-        else:
-            objective = analysis.get('objective')
-            audience = analysis.get('audience')
-            content_goals = analysis.get('content_goals', [])
-        
-        if objective:
-            summary_parts.append(f"OBJETIVO: {objective}")
-        
-        if audience:
-            summary_parts.append(f"AUDIENCIA: {audience}")
-        
-        if content_goals:
-            summary_parts.append(f"METAS: {', '.join(content_goals)}")
-        
-        return "\n".join(summary_parts)
+        """Crea resumen del análisis (dict o PromptAnalysis) para el prompt"""
+        return _analysis_summary(
+            state_field(analysis, 'objective'),
+            state_field(analysis, 'audience'),
+            tuple(state_field(analysis, 'content_goals') or ())
+        )
     
     def _create_brand_voice_summary(self, brand_voice) -> str:
-        """Crea resumen de la voz de marca para el prompt"""
-        summary_parts = []
-        
-        # Manejar tanto dict como objeto BrandVoice
-        if hasattr(brand_voice, 'tone'):
-            tone = brand_voice.tone
-            personality = brand_voice.personality
-            style = brand_voice.style
-            language_level = brand_voice.language_level
-        else:
-            tone = brand_voice.get('tone')
-            personality = brand_voice.get('personality')
-            style = brand_voice.get('style')
-            language_level = brand_voice.get('language_level')
-        
-        if tone:
-            summary_parts.append(f"TONO: {tone}")
-        
-        if personality:
-            summary_parts.append(f"PERSONALIDAD: {personality}")
-        
-        if style:
-            summary_parts.append(f"ESTILO: {style}")
-        
-        if language_level:
-            summary_parts.append(f"NIVEL DE LENGUAJE: {language_level}")
-        
-        return "\n".join(summary_parts)
+        """Crea resumen de la voz de marca (dict o BrandVoice) para el prompt"""
+        return _brand_voice_summary(
+            state_field(brand_voice, 'tone'),
+            state_field(brand_voice, 'personality'),
+            state_field(brand_voice, 'style'),
+            state_field(brand_voice, 'language_level')
+        )
     
     def _create_facts_summary(self, factual_grounding) -> str:
-        """Crea resumen de los hechos para el prompt"""
-        # Manejar tanto dict como objeto FactualGrounding
-        if hasattr(factual_grounding, 'key_facts'):
-            key_facts = factual_grounding.key_facts
-        else:
-            key_facts = factual_grounding.get('key_facts', [])
-        
-        if key_facts:
-            return f"HECHOS CLAVE: {', '.join(key_facts)}"
-        return "HECHOS: Información del prompt analizada"
+        """Crea resumen de los hechos (dict o FactualGrounding) para el prompt"""
+        return _facts_summary(tuple(state_field(factual_grounding, 'key_facts') or ()))
     
     def _clean_and_validate_content(self, content: str) -> str:
         """
@@ -182,14 +181,10 @@ class TextGenerator:
         cleaned = content.strip()
         
         # Remover marcadores de formato si existen
-        cleaned = cleaned.replace("```", "").replace("**", "").replace("*", "")
-        
-        # Remover líneas vacías múltiples
-        import re
-        cleaned = re.sub(r'\n\s*\n', '\n\n', cleaned)
+        cleaned = _FORMAT_MARKERS.sub('', cleaned)
         
-        # Asegurar que no empiece con números o guiones
-        cleaned = re.sub(r'^[\d\-\.\s]+', '', cleaned)
+        # Remover líneas vacías múltiples y asegurar que no empiece con números o guiones
+        cleaned = _LAYOUT_JUNK.sub(_replace_layout_junk, cleaned)
         
         # Limitar longitud máxima (para redes sociales)
         max_length = 2000
@@ -227,6 +222,6 @@ class TextGenerator:
             return self._clean_and_validate_content(response)
             
         except Exception as e:
-            self.logger.error(f"Error generando contenido: {e}")
+            logger.error("Error generando contenido: %s", e)
             raise
 
@@ -2,14 +2,68 @@
 Video Scripter - Crea scripts estructurados para videos de formato corto
 """
 import logging
+import re
 import time
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, Final, Mapping, Tuple
 
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.graph.state import state_field, update_state_with_video_script
+from src.config.prompts import render_prompt, shared_context_block, AGENT_TEMPLATES
 
 logger = logging.getLogger(__name__)
 
+# Formatos recomendados que admiten un script de video completo
+_VIDEO_FMT_RE = re.compile(r'video|reel|tiktok|short-form video|instagram reel|youtube short', re.IGNORECASE)
+
+# Script básico para formatos sin video. Se comparte entre llamadas: no modificar
+_DEFAULT_SCRIPT_SEGMENTS: Final[Tuple[Mapping[str, str], ...]] = (
+    MappingProxyType({
+        "timestamp": "0-3s",
+        "narration": "Hook: Attention-grabbing opening",
+        "visual_cue": "Dynamic opening shot"
+    }),
+    MappingProxyType({
+        "timestamp": "3-10s",
+        "narration": "Main content presentation",
+        "visual_cue": "Product/service showcase"
+    }),
+    MappingProxyType({
+        "timestamp": "10-15s",
+        "narration": "Call to action",
+        "visual_cue": "Clear CTA visual"
+    })
+)
+
+def _basic_script(platform: str) -> Dict[str, Any]:
+    """Construye un script básico nuevo; los segmentos no se comparten entre estados"""
+    return {
+        "script_segments": [dict(segment) for segment in _DEFAULT_SCRIPT_SEGMENTS],
+        "total_duration": "15 seconds",
+        "music_style": "Upbeat and engaging",
+        "platform_optimized": platform
+    }
+
+# Duración objetivo y hashtags por plataforma (tablas de solo lectura)
+_PLATFORM_DURATIONS: Final[Mapping[str, str]] = MappingProxyType({
+    "tiktok": "15-30s",
+    "instagram": "15-30s",
+    "youtube": "30-60s",
+    "linkedin": "30-60s",
+    "twitter": "15-30s"
+})
+
+_PLATFORM_HASHTAGS: Final[Mapping[str, Tuple[str, ...]]] = MappingProxyType({
+    "tiktok": ("#FYP", "#Viral"),
+    "instagram": ("#Reels", "#Trending"),
+    "youtube": ("#Shorts", "#YouTube"),
+    "linkedin": ("#Professional", "#Business")
+})
+
+def is_video_format(recommended_format: str) -> bool:
+    """Indica si el formato recomendado admite un script de video completo"""
+    return _VIDEO_FMT_RE.search(recommended_format) is not None
+
 class VideoScripter:
     """
     Agente que crea scripts estructurados para videos de formato corto (Reels, TikTok, Shorts)
@@ -17,7 +71,6 @@ class VideoScripter:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
-        self.logger = logging.getLogger(__name__)
     
     async def process(self, state) -> Dict[str, Any]:
         """
@@ -29,69 +82,30 @@ class VideoScripter:
         Returns:
             Estado actualizado con script de video
         """
-        start_time = time.time()
+        start = time.perf_counter()
         
         try:
-            self.logger.info("Iniciando creación de script de video")
+            logger.info("Iniciando creación de script de video")
             
-            # Get platform info early
-            platform = getattr(state.get("prompt_analysis"), 'platform', 'Instagram') if state.get("prompt_analysis") else 'Instagram'
+            # Plataforma calculada una sola vez (prompt_analysis puede ser modelo o diccionario)
+            platform = state_field(state.get("prompt_analysis"), 'platform') or 'Instagram'
             
             # Verificar si se recomienda formato de video
             visual_format = state.get("visual_format_recommendation", {})
             recommended_format = visual_format.get("recommended_format", "Image")
             
             # Check if format supports video (more flexible check)
-            video_formats = ["video", "reel", "tiktok", "short-form video", "instagram reel", "youtube short"]
-            if not any(fmt in recommended_format.lower() for fmt in video_formats):
-                self.logger.info(f"Formato '{recommended_format}' no es compatible con video, creando script básico")
+            if not is_video_format(recommended_format):
+                logger.info("Formato '%s' no es compatible con video, creando script básico", recommended_format)
                 # Create a basic video script anyway for demonstration
-                basic_script = {
-                    "script_segments": [
-                        {
-                            "timestamp": "0-3s",
-                            "narration": "Hook: Attention-grabbing opening",
-                            "visual_cue": "Dynamic opening shot"
-                        },
-                        {
-                            "timestamp": "3-10s", 
-                            "narration": "Main content presentation",
-                            "visual_cue": "Product/service showcase"
-                        },
-                        {
-                            "timestamp": "10-15s",
-                            "narration": "Call to action",
-                            "visual_cue": "Clear CTA visual"
-                        }
-                    ],
-                    "total_duration": "15 seconds",
-                    "music_style": "Upbeat and engaging",
-                    "platform_optimized": platform
-                }
+                basic_script = _basic_script(platform)
                 
-                # Actualizar estado usando función de estado
-                from graph.state import update_state_with_video_script, WorkflowState
-                if isinstance(state, dict):
-                    workflow_state = WorkflowState(**state)
-                    workflow_state = update_state_with_video_script(workflow_state, basic_script)
-                    state.update(workflow_state.dict())
-                else:
-                    state = update_state_with_video_script(state, basic_script)
-                
-                # Registrar tiempo del agente
-                processing_time = time.time() - start_time
-                if isinstance(state, dict):
-                    if "agent_timings" not in state:
-                        state["agent_timings"] = {}
-                    state["agent_timings"]["video_scripter"] = processing_time
-                else:
-                    if not hasattr(state, 'agent_timings'):
-                        state.agent_timings = {}
-                    state.agent_timings["video_scripter"] = processing_time
+                # Actualizar estado en el sitio, sin validar de nuevo todo el WorkflowState
+                state = update_state_with_video_script(state, basic_script)
                 
                 return state
             else:
-                self.logger.info(f"Formato '{recommended_format}' es compatible con video, generando script completo")
+                logger.info("Formato '%s' es compatible con video, generando script completo", recommended_format)
                 
                 # Verificar elementos necesarios
                 required_elements = ["core_content", "prompt_analysis"]
@@ -104,11 +118,11 @@ class VideoScripter:
                 language = language_config.get("language", "es")
                 
                 core_content = state["core_content"]
-                platform = getattr(state["prompt_analysis"], 'platform', 'Instagram')
                 duration = self._determine_duration(platform)
                 
-                template = get_prompt_template(AGENT_TEMPLATES["video_scripter"], language)
-                prompt = template.format(
+                prompt = render_prompt(
+                    AGENT_TEMPLATES["video_scripter"],
+                    language,
                     core_content=core_content,
                     visual_format=recommended_format,
                     platform=platform,
@@ -116,33 +130,34 @@ class VideoScripter:
                 )
                 
                 # Llamar al LLM
-                self.logger.info("Generando script de video con LLM")
+                logger.info("Generando script de video con LLM")
                 response = await self.llm.generate_structured(
                     prompt=prompt,
-                    expected_format="JSON con script de video"
+                    expected_format="JSON con script de video",
+                    system_prompt=shared_context_block(state)
                 )
                 
                 # Parsear respuesta
-                self.logger.info("Parseando script de video")
+                logger.debug("Parseando script de video")
                 video_script = self._parse_video_script(response)
             
             # Validar y mejorar script
             video_script = self._validate_and_enhance_script(video_script, platform)
             
-            # Actualizar estado usando función de estado
-            from graph.state import update_state_with_video_script, WorkflowState
-            if isinstance(state, dict):
-                workflow_state = WorkflowState(**state)
-                workflow_state = update_state_with_video_script(workflow_state, video_script)
-                state.update(workflow_state.dict())
-            else:
-                state = update_state_with_video_script(state, video_script)
+            # Actualizar estado en el sitio, sin validar de nuevo todo el WorkflowState
+            state = update_state_with_video_script(state, video_script)
             
-            # Log del proceso
-            processing_time = time.time() - start_time
-            self.logger.info(f"Script de video generado en {processing_time:.2f}s")
+            return state
             
-            # Registrar tiempo del agente
+        except Exception as e:
+            error_msg = f"Error en Video Scripter: {str(e)}"
+            logger.error(error_msg)
+            state["errors"].append(error_msg)
+            return state
+        
+        finally:
+            # Registrar tiempo del agente (un único cálculo para todas las salidas)
+            processing_time = time.perf_counter() - start
             if isinstance(state, dict):
                 if "agent_timings" not in state:
                     state["agent_timings"] = {}
@@ -151,25 +166,11 @@ class VideoScripter:
                 if not hasattr(state, 'agent_timings'):
                     state.agent_timings = {}
                 state.agent_timings["video_scripter"] = processing_time
-            
-            return state
-            
-        except Exception as e:
-            error_msg = f"Error en Video Scripter: {str(e)}"
-            self.logger.error(error_msg)
-            state["errors"].append(error_msg)
-            return state
+            logger.info("Video Scripter finalizado en %.2fs", processing_time)
     
     def _determine_duration(self, platform: str) -> str:
         """Determina la duración objetivo según la plataforma"""
-        platform_durations = {
-            "tiktok": "15-30s",
-            "instagram": "15-30s", 
-            "youtube": "30-60s",
-            "linkedin": "30-60s",
-            "twitter": "15-30s"
-        }
-        return platform_durations.get(platform.lower(), "15-30s")
+        return _PLATFORM_DURATIONS.get(platform.lower(), "15-30s")
     
     def _parse_video_script(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """Parsea la respuesta del LLM"""
@@ -215,14 +216,7 @@ class VideoScripter:
             script["engagement_elements"] = ["Pregunta al inicio", "Call to action claro"]
         
         # Agregar hashtags específicos de plataforma
-        platform_hashtags = {
-            "tiktok": ["#FYP", "#Viral"],
-            "instagram": ["#Reels", "#Trending"],
-            "youtube": ["#Shorts", "#YouTube"],
-            "linkedin": ["#Professional", "#Business"]
-        }
-        
-        platform_specific = platform_hashtags.get(platform.lower(), [])
-        script["hashtags"].extend(platform_specific)
+        plat = platform.lower()
+        script["hashtags"].extend(_PLATFORM_HASHTAGS.get(plat, ()))
         
         return script
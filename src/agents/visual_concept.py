@@ -1,16 +1,37 @@
 """
 Agente Visual Concept - Genera brief detallado para el diseñador
 """
+import functools
 import logging
 import time
 from typing import Dict, Any
 
 from src.models.content_brief import VisualConcept
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.settings import gemini_service_tier
+from src.config.prompts import render_prompt, shared_context_block, AGENT_TEMPLATES
+from src.graph.state import state_field
 
 logger = logging.getLogger(__name__)
 
+# Paleta por defecto cuando el LLM no devuelve colores válidos
+_DEFAULT_PALETTE = ("#2E86AB", "#A23B72", "#F18F01", "#C73E1D")
+
+@functools.lru_cache(maxsize=1024)
+def _brand_voice_summary(tone, personality, style, values: tuple) -> str:
+    """Resumen de la voz de marca a partir de sus campos (memoizado)"""
+    if tone and personality and style and values:
+        return f"TONO: {tone}\nPERSONALIDAD: {personality}\nESTILO: {style}\nVALORES: {', '.join(values)}"
+    
+    summary = (
+        (f"TONO: {tone}\n" if tone else "")
+        + (f"PERSONALIDAD: {personality}\n" if personality else "")
+        + (f"ESTILO: {style}\n" if style else "")
+        + (f"VALORES: {', '.join(values)}\n" if values else "")
+    )
+    # Quitar solo el separador final añadido
+    return summary[:-1]
+
 class VisualConceptAgent:
     """
     Agente que genera un concepto visual detallado para el diseñador
@@ -18,7 +39,7 @@ class VisualConceptAgent:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
-        self.logger = logging.getLogger(__name__)
+        self.service_tier = gemini_service_tier("visual_concept")
     
     async def process(self, state) -> Dict[str, Any]:
         """
@@ -30,10 +51,10 @@ class VisualConceptAgent:
         Returns:
             Estado actualizado con el concepto visual
         """
-        start_time = time.time()
+        start = time.perf_counter()
         
         try:
-            self.logger.info("Iniciando generación de concepto visual")
+            logger.info("Iniciando generación de concepto visual")
             
             # Verificar que tenemos todos los elementos necesarios
             required_elements = ["core_content", "post_type", "brand_voice", "prompt_analysis"]
@@ -48,16 +69,11 @@ class VisualConceptAgent:
             core_content = state["core_content"]
             post_type = state["post_type"].value
             brand_voice_summary = self._create_brand_voice_summary(state["brand_voice"])
+            objective = state_field(state["prompt_analysis"], 'objective', 'Crear contenido visual atractivo')
             
-            # Manejar tanto dict como objeto PromptAnalysis
-            prompt_analysis = state["prompt_analysis"]
-            if hasattr(prompt_analysis, 'objective'):
-                objective = prompt_analysis.objective
-            else:
-                objective = prompt_analysis.get('objective', 'Crear contenido visual atractivo')
-            
-            template = get_prompt_template(AGENT_TEMPLATES["visual_concept"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["visual_concept"],
+                language,
                 core_content=core_content,
                 post_type=post_type,
                 brand_voice=brand_voice_summary,
@@ -65,18 +81,20 @@ class VisualConceptAgent:
             )
             
             # 2. Llamar al LLM
-            self.logger.info("Generando concepto visual con LLM")
+            logger.info("Generando concepto visual con LLM")
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con concepto visual"
+                expected_format="JSON con concepto visual",
+                system_prompt=shared_context_block(state),
+                service_tier=self.service_tier
             )
             
             # 3. Parsear respuesta
-            self.logger.info("Parseando concepto visual del LLM")
+            logger.debug("Parseando concepto visual del LLM")
             visual_concept = VisualConcept(**response)
             
             # 4. Validar y mejorar output
-            self.logger.info("Validando y mejorando concepto visual")
+            logger.debug("Validando y mejorando concepto visual")
             visual_concept = self._validate_and_enhance_visual_concept(visual_concept)
             
             # 5. Actualizar estado
@@ -85,58 +103,34 @@ class VisualConceptAgent:
             state["completed_steps"].append("visual_concept")
             
             # 6. Log del proceso
-            generation_time = time.time() - start_time
-            self.logger.info(f"Concepto visual generado en {generation_time:.2f}s")
-            self.logger.info(f"Mood: {visual_concept.mood}")
-            self.logger.info(f"Colores: {len(visual_concept.color_palette)}")
-            
-            # Registrar tiempo del agente
-            state["agent_timings"]["visual_concept"] = generation_time
+            logger.debug("Mood: %s", visual_concept.mood)
+            logger.debug("Colores: %d", len(visual_concept.color_palette))
             
         except Exception as e:
-            generation_time = time.time() - start_time
             error_msg = f"Error en VisualConceptAgent: {str(e)}"
-            self.logger.error(error_msg)
+            logger.error(error_msg)
             
             # Actualizar estado con error
             state["errors"].append(f"[visual_concept]: {error_msg}")
             state["current_step"] = "error"
             state["is_error"] = True
-            
-            # Registrar tiempo del agente
+        
+        finally:
+            # Registrar tiempo del agente (un único cálculo para éxito y error)
+            generation_time = time.perf_counter() - start
             state["agent_timings"]["visual_concept"] = generation_time
+            logger.info("VisualConceptAgent finalizado en %.2fs", generation_time)
         
         return state
     
     def _create_brand_voice_summary(self, brand_voice) -> str:
-        """Crea resumen de la voz de marca para el prompt"""
-        summary_parts = []
-        
-        # Manejar tanto dict como objeto BrandVoice
-        if hasattr(brand_voice, 'tone'):
-            tone = brand_voice.tone
-            personality = brand_voice.personality
-            style = getattr(brand_voice, 'style', None)
-            values = getattr(brand_voice, 'values', [])
-        else:
-            tone = brand_voice.get('tone')
-            personality = brand_voice.get('personality')
-            style = brand_voice.get('style')
-            values = brand_voice.get('values', [])
-        
-        if tone:
-            summary_parts.append(f"TONO: {tone}")
-        
-        if personality:
-            summary_parts.append(f"PERSONALIDAD: {personality}")
-        
-        if style:
-            summary_parts.append(f"ESTILO: {style}")
-        
-        if values:
-            summary_parts.append(f"VALORES: {', '.join(values)}")
-        
-        return "\n".join(summary_parts)
+        """Crea resumen de la voz de marca (dict o BrandVoice) para el prompt"""
+        return _brand_voice_summary(
+            state_field(brand_voice, 'tone'),
+            state_field(brand_voice, 'personality'),
+            state_field(brand_voice, 'style'),
+            tuple(state_field(brand_voice, 'values') or ())
+        )
     
     def _validate_and_enhance_visual_concept(self, visual_concept: VisualConcept) -> VisualConcept:
         """
@@ -154,7 +148,7 @@ class VisualConceptAgent:
         
         # Validar paleta de colores
         if not visual_concept.color_palette:
-            visual_concept.color_palette = ["#2E86AB", "#A23B72", "#F18F01", "#C73E1D"]
+            visual_concept.color_palette = list(_DEFAULT_PALETTE)
         else:
             # Limpiar colores
             cleaned_colors = []
@@ -165,7 +159,7 @@ class VisualConceptAgent:
             
             # Asegurar al menos 3 colores
             if len(cleaned_colors) < 3:
-                cleaned_colors.extend(["#2E86AB", "#A23B72", "#F18F01"])
+                cleaned_colors.extend(_DEFAULT_PALETTE[:3])
             
             visual_concept.color_palette = cleaned_colors[:6]  # Máximo 6 colores
         
@@ -208,8 +202,9 @@ class VisualConceptAgent:
             brand_voice_summary = self._create_brand_voice_summary(brand_voice)
             engagement_summary = self._create_engagement_summary(engagement_elements)
             
-            template = get_prompt_template(AGENT_TEMPLATES["visual_concept"], language)
-            prompt = template.format(
+            prompt = render_prompt(
+                AGENT_TEMPLATES["visual_concept"],
+                language,
                 core_content=core_content,
                 post_type=post_type.value,
                 brand_voice=brand_voice_summary,
@@ -218,13 +213,14 @@ class VisualConceptAgent:
             
             response = await self.llm.generate_structured(
                 prompt=prompt,
-                expected_format="JSON con concepto visual"
+                expected_format="JSON con concepto visual",
+                service_tier=self.service_tier
             )
             
             visual_concept = VisualConcept(**response)
             return self._validate_and_enhance_visual_concept(visual_concept)
             
         except Exception as e:
-            self.logger.error(f"Error creando concepto visual: {e}")
+            logger.error("Error creando concepto visual: %s", e)
             raise
 
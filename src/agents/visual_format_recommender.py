@@ -1,16 +1,36 @@
 """
 Visual Format Recommender - Recomienda el formato visual más efectivo
 """
+import asyncio
+import copy
+import hashlib
 import logging
+import operator
 import time
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 from enum import Enum
 
 from src.tools.llm_client import LLMClient
-from src.config.prompts import get_prompt_template, AGENT_TEMPLATES
+from src.config.prompts import compile_prompt_template, AGENT_TEMPLATES
+from src.config.settings import get_settings
+from src.graph.state import state_field, update_state_with_visual_format
 
 logger = logging.getLogger(__name__)
 
+# Plantillas compiladas una sola vez por idioma
+_FORMATTERS = {
+    language: compile_prompt_template(AGENT_TEMPLATES["visual_format_recommender"], language)
+    for language in ("es", "en")
+}
+
+# Elementos del estado necesarios, leídos con una sola llamada
+_REQUIRED_ELEMENTS = ("prompt_analysis", "post_type", "brand_voice")
+_get_required_elements = operator.itemgetter(*_REQUIRED_ELEMENTS)
+
+# Caché local de recomendaciones (LRU con expiración)
+_RECOMMENDATION_CACHE_MAX_ENTRIES = 2048
+
 class VisualFormat(Enum):
     """Tipos de formato visual"""
     IMAGE = "Image"
@@ -18,6 +38,10 @@ class VisualFormat(Enum):
     CAROUSEL = "Carousel"
     INFOGRAPHIC = "Infographic"
 
+# Formatos válidos y ajuste de confianza según la complejidad de producción
+_VALID_FORMATS = frozenset(visual_format.value for visual_format in VisualFormat)
+_COMPLEXITY_DELTA = {"low": 0.1, "high": -0.1}
+
 class VisualFormatRecommender:
     """
     Agente que recomienda el formato visual más efectivo basado en el contenido y plataforma
@@ -25,7 +49,15 @@ class VisualFormatRecommender:
     
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
-        self.logger = logging.getLogger(__name__)
+        
+        settings = get_settings()
+        self.enable_caching = settings.enable_caching
+        self.cache_ttl = settings.cache_duration_hours * 3600
+        self.provider = settings.visual_format_recommender_model
+        self.groq_model = settings.visual_format_recommender_groq_model
+        self.batch_max_concurrency = settings.batch_max_concurrency
+        self._recommendation_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.cache_hits = 0
     
     async def process(self, state) -> Dict[str, Any]:
         """
@@ -37,60 +69,76 @@ class VisualFormatRecommender:
         Returns:
             Estado actualizado con recomendación de formato visual
         """
-        start_time = time.time()
+        start = time.perf_counter()
         
         try:
-            self.logger.info("Iniciando recomendación de formato visual")
+            logger.info("Iniciando recomendación de formato visual")
             
             # Verificar elementos necesarios
-            required_elements = ["prompt_analysis", "post_type", "brand_voice"]
-            for element in required_elements:
-                if not state.get(element):
-                    raise ValueError(f"Elemento requerido no disponible: {element}")
+            try:
+                required_values = _get_required_elements(state)
+            except KeyError as e:
+                raise ValueError(f"Elemento requerido no disponible: {e.args[0]}")
+            if not all(required_values):
+                missing = next(name for name, value in zip(_REQUIRED_ELEMENTS, required_values) if not value)
+                raise ValueError(f"Elemento requerido no disponible: {missing}")
+            raw_analysis, post_type_value, _ = required_values
             
             # Preparar prompt específico según idioma
             language_config = state.get("language_config", {})
             language = language_config.get("language", "es")
             
-            analysis_summary = self._create_analysis_summary(state["prompt_analysis"])
-            post_type = state["post_type"].value
-            platform = getattr(state["prompt_analysis"], 'platform', 'general')
-            
-            template = get_prompt_template(AGENT_TEMPLATES["visual_format_recommender"], language)
-            prompt = template.format(
-                analysis=analysis_summary,
-                post_type=post_type,
-                platform=platform
-            )
+            # El análisis puede ser un modelo Pydantic o un diccionario
+            platform = state_field(raw_analysis, 'platform') or 'general'
+            analysis_summary = self._create_analysis_summary(raw_analysis, platform)
+            post_type = post_type_value.value
             
-            # Llamar al LLM
-            self.logger.info("Generando recomendación de formato visual con LLM")
-            response = await self.llm.generate_structured(
-                prompt=prompt,
-                expected_format="JSON con recomendación de formato visual"
-            )
-            
-            # Parsear respuesta
-            self.logger.info("Parseando recomendación de formato visual")
-            format_recommendation = self._parse_format_recommendation(response)
-            
-            # Validar y mejorar recomendación
-            format_recommendation = self._validate_and_enhance_recommendation(format_recommendation)
-            
-            # Actualizar estado usando función de estado
-            from graph.state import update_state_with_visual_format, WorkflowState
-            if isinstance(state, dict):
-                workflow_state = WorkflowState(**state)
-                workflow_state = update_state_with_visual_format(workflow_state, format_recommendation)
-                state.update(workflow_state.dict())
+            cache_key = self._cache_key(language, post_type, platform, analysis_summary)
+            format_recommendation = self._get_cached_recommendation(cache_key)
+            if format_recommendation is not None:
+                self.cache_hits += 1
+                logger.debug("Recomendación de formato visual servida desde caché")
             else:
-                state = update_state_with_visual_format(state, format_recommendation)
+                render_prompt = _FORMATTERS.get(language, _FORMATTERS["es"])
+                prompt = render_prompt(
+                    analysis=analysis_summary,
+                    post_type=post_type,
+                    platform=platform
+                )
+                
+                # Llamar al LLM por streaming: el JSON se parsea en cuanto se cierra
+                logger.debug("Generando recomendación de formato visual con LLM")
+                response = await self.llm.stream_structured(
+                    prompt=prompt,
+                    expected_format="JSON con recomendación de formato visual",
+                    provider=self.provider,
+                    groq_model=self.groq_model,
+                    json_mode=True,
+                    temperature=0,
+                    max_tokens=512
+                )
+                
+                # Parsear y validar respuesta
+                logger.debug("Parseando recomendación de formato visual")
+                format_recommendation = self._build_recommendation(response)
+                # Solo se cachean respuestas reales: un error o respaldo acaba en el formato por defecto
+                if response.get("recommended_format") in _VALID_FORMATS:
+                    self._store_recommendation(cache_key, format_recommendation)
+            
+            # Actualizar estado en el sitio, sin validar de nuevo todo el WorkflowState
+            state = update_state_with_visual_format(state, format_recommendation)
             
-            # Log del proceso
-            processing_time = time.time() - start_time
-            self.logger.info(f"Recomendación de formato visual generada en {processing_time:.2f}s")
+            return state
             
-            # Registrar tiempo del agente
+        except Exception as e:
+            error_msg = f"Error en Visual Format Recommender: {str(e)}"
+            logger.error(error_msg)
+            state["errors"].append(error_msg)
+            return state
+        
+        finally:
+            # Registrar tiempo del agente (un único cálculo para todas las salidas)
+            processing_time = time.perf_counter() - start
             if isinstance(state, dict):
                 if "agent_timings" not in state:
                     state["agent_timings"] = {}
@@ -99,62 +147,90 @@ class VisualFormatRecommender:
                 if not hasattr(state, 'agent_timings'):
                     state.agent_timings = {}
                 state.agent_timings["visual_format_recommender"] = processing_time
-            
-            return state
-            
-        except Exception as e:
-            error_msg = f"Error en Visual Format Recommender: {str(e)}"
-            self.logger.error(error_msg)
-            state["errors"].append(error_msg)
-            return state
+            logger.info("Visual Format Recommender finalizado en %.2fs", processing_time)
     
-    def _create_analysis_summary(self, analysis) -> str:
-        """Crea un resumen del análisis del prompt"""
-        if hasattr(analysis, 'objective'):
-            return f"Objetivo: {analysis.objective}, Audiencia: {analysis.audience}, Plataforma: {getattr(analysis, 'platform', 'general')}"
-        else:
-            return f"Objetivo: {analysis.get('objective', 'N/A')}, Audiencia: {analysis.get('audience', 'N/A')}"
+    async def process_batch(self, states: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Procesa varios estados a la vez (evaluaciones offline o generación masiva)
+        
+        Args:
+            states: Estados del workflow con análisis previo
+            
+        Returns:
+            Estados actualizados, en el mismo orden
+        """
+        semaphore = asyncio.Semaphore(self.batch_max_concurrency)
+        
+        async def _process_one(state):
+            async with semaphore:
+                return await self.process(state)
+        
+        return list(await asyncio.gather(*(_process_one(state) for state in states)))
     
-    def _parse_format_recommendation(self, response: Dict[str, Any]) -> Dict[str, Any]:
-        """Parsea la respuesta del LLM"""
-        return {
-            "recommended_format": response.get("recommended_format", "Image"),
-            "justification": response.get("justification", ""),
-            "platform_optimization": response.get("platform_optimization", ""),
-            "engagement_potential": response.get("engagement_potential", "medium"),
-            "production_complexity": response.get("production_complexity", "low"),
-            "alternative_formats": response.get("alternative_formats", [])
-        }
+    @staticmethod
+    def _cache_key(language: str, post_type: str, platform: str, analysis_summary: str) -> str:
+        """Clave compacta para las entradas que determinan la recomendación"""
+        raw = f"{language}|{post_type}|{platform}|{analysis_summary}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
     
-    def _validate_and_enhance_recommendation(self, recommendation: Dict[str, Any]) -> Dict[str, Any]:
-        """Valida y mejora la recomendación"""
-        # Validar formato recomendado
-        valid_formats = ["Image", "Video", "Carousel", "Infographic"]
-        if recommendation["recommended_format"] not in valid_formats:
-            recommendation["recommended_format"] = "Video"  # Default to Video for better engagement
+    def _get_cached_recommendation(self, key: str) -> Optional[Dict[str, Any]]:
+        """Devuelve una copia de la recomendación ya validada si está en caché y no ha expirado"""
+        if not self.enable_caching:
+            return None
         
-        # Agregar confidence score basado en el análisis
-        recommendation["confidence_score"] = self._calculate_confidence_score(recommendation)
+        entry = self._recommendation_cache.get(key)
+        if entry is None:
+            return None
         
-        # Asegurar que hay justificación
-        if not recommendation["justification"]:
-            recommendation["justification"] = f"Format {recommendation['recommended_format']} recommended to optimize engagement"
+        stored_at, recommendation = entry
+        if time.monotonic() - stored_at > self.cache_ttl:
+            del self._recommendation_cache[key]
+            return None
         
-        return recommendation
+        self._recommendation_cache.move_to_end(key)
+        return copy.deepcopy(recommendation)
     
-    def _calculate_confidence_score(self, recommendation: Dict[str, Any]) -> float:
-        """Calcula un score de confianza para la recomendación"""
-        base_score = 0.7
+    def _store_recommendation(self, key: str, recommendation: Dict[str, Any]) -> None:
+        """Guarda una copia de la recomendación ya validada en la caché LRU"""
+        if not self.enable_caching:
+            return
         
-        # Aumentar confianza si es video (mejor engagement)
-        if recommendation["recommended_format"] == "Video":
-            base_score += 0.2
+        self._recommendation_cache[key] = (time.monotonic(), copy.deepcopy(recommendation))
+        self._recommendation_cache.move_to_end(key)
+        if len(self._recommendation_cache) > _RECOMMENDATION_CACHE_MAX_ENTRIES:
+            self._recommendation_cache.popitem(last=False)
+    
+    def clear_cache(self) -> None:
+        """Vacía la caché de recomendaciones"""
+        self._recommendation_cache.clear()
+    
+    def _create_analysis_summary(self, analysis, platform: str) -> str:
+        """Crea un resumen del análisis del prompt (dict o PromptAnalysis)"""
+        objective = state_field(analysis, 'objective', 'N/A')
+        audience = state_field(analysis, 'audience', 'N/A')
+        return f"Objetivo: {objective}, Audiencia: {audience}, Plataforma: {platform}"
+    
+    def _build_recommendation(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Parsea, valida y completa la respuesta del LLM en una sola pasada"""
+        # Validar formato recomendado
+        recommended_format = response.get("recommended_format", "Image")
+        if recommended_format not in _VALID_FORMATS:
+            recommended_format = "Video"  # Default to Video for better engagement
         
-        # Ajustar por complejidad de producción
-        complexity = recommendation.get("production_complexity", "medium")
-        if complexity == "low":
-            base_score += 0.1
-        elif complexity == "high":
-            base_score -= 0.1
-            
-        return min(base_score, 1.0)
+        # Confidence score: más alto para video, ajustado por complejidad de producción
+        complexity = response.get("production_complexity", "low")
+        confidence_score = 0.7
+        if recommended_format == "Video":
+            confidence_score += 0.2
+        confidence_score += _COMPLEXITY_DELTA.get(complexity, 0.0)
+        
+        return {
+            "recommended_format": recommended_format,
+            "justification": response.get("justification")
+                or f"Format {recommended_format} recommended to optimize engagement",
+            "platform_optimization": response.get("platform_optimization", ""),
+            "engagement_potential": response.get("engagement_potential", "medium"),
+            "production_complexity": complexity,
+            "alternative_formats": response.get("alternative_formats", []),
+            "confidence_score": min(confidence_score, 1.0)
+        }
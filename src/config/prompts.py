@@ -2,71 +2,56 @@
 Prompts específicos y optimizados para cada agente del sistema de marketing
 Incluye versiones en español e inglés para optimizar tokens
 """
+import functools
+from string import Formatter
+from types import MappingProxyType
+from typing import Callable, Final, Mapping
+
+# ========== BLOQUES COMUNES ==========
+# Cierre de los templates que esperan solo JSON
+_JSON_ONLY_FOOTER_ES = "IMPORTANTE: Solo responde con el JSON, sin texto adicional.\n"
+_JSON_ONLY_FOOTER_EN = "IMPORTANT: Only respond with the JSON, no additional text.\n"
 
 # ========== PROMPT ANALYZER ==========
 # Versión en español
 PROMPT_ANALYZER_TEMPLATE_ES = """
-Analiza este prompt de marketing y extrae información estructurada:
+Extrae información estructurada de este prompt de marketing:
 
 PROMPT: "{prompt}"
 
-Extrae y estructura la siguiente información:
-
-1. OBJETIVO: ¿Qué quiere lograr? (ventas, awareness, engagement, etc.)
-2. AUDIENCIA: ¿A quién se dirige? (demografía, psychografía)
-3. BRAND CUES: ¿Qué indica sobre la marca? (tono, personalidad, valores)
-4. HECHOS CLAVE: Datos específicos mencionados (nombres, fechas, números)
-5. URGENCIA: ¿Hay elementos de urgencia temporal?
-6. PLATAFORMA: ¿Se menciona alguna plataforma específica?
-7. TONO: Indicadores de tono de comunicación
-8. METAS: Objetivos específicos de contenido
-
-Responde SOLO en formato JSON válido con esta estructura:
+Responde SOLO con JSON válido (cada valor describe qué extraer):
 {{
-    "objective": "string",
-    "audience": "string", 
-    "brand_cues": ["string"],
-    "key_facts": ["string"],
-    "urgency": "string o null",
-    "platform": "string o null",
-    "tone_indicators": ["string"],
-    "content_goals": ["string"]
+    "objective": "qué quiere lograr (ventas, awareness, engagement...)",
+    "audience": "a quién se dirige (demografía, psicografía)",
+    "brand_cues": ["tono, personalidad o valores de la marca"],
+    "key_facts": ["nombres, fechas o números mencionados"],
+    "urgency": "urgencia temporal o null",
+    "platform": "plataforma mencionada o null",
+    "tone_indicators": ["indicadores de tono"],
+    "content_goals": ["metas concretas del contenido"]
 }}
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 PROMPT_ANALYZER_TEMPLATE_EN = """
-Analyze this marketing prompt and extract structured information:
+Extract structured information from this marketing prompt:
 
 PROMPT: "{prompt}"
 
-Extract and structure the following information:
-
-1. OBJECTIVE: What does it want to achieve? (sales, awareness, engagement, etc.)
-2. AUDIENCE: Who is it targeting? (demographics, psychographics)
-3. BRAND CUES: What does it indicate about the brand? (tone, personality, values)
-4. KEY FACTS: Specific data mentioned (names, dates, numbers)
-5. URGENCY: Are there temporal urgency elements?
-6. PLATFORM: Is any specific platform mentioned?
-7. TONE: Communication tone indicators
-8. GOALS: Specific content objectives
-
-Respond ONLY in valid JSON format with this structure:
+Respond ONLY with valid JSON (each value describes what to extract):
 {{
-    "objective": "string",
-    "audience": "string", 
-    "brand_cues": ["string"],
-    "key_facts": ["string"],
-    "urgency": "string or null",
-    "platform": "string or null",
-    "tone_indicators": ["string"],
-    "content_goals": ["string"]
+    "objective": "what it wants to achieve (sales, awareness, engagement...)",
+    "audience": "who it targets (demographics, psychographics)",
+    "brand_cues": ["brand tone, personality or values"],
+    "key_facts": ["names, dates or numbers mentioned"],
+    "urgency": "temporal urgency or null",
+    "platform": "platform mentioned or null",
+    "tone_indicators": ["tone indicators"],
+    "content_goals": ["specific content goals"]
 }}
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== POST CLASSIFIER ==========
 # Versión en español
@@ -89,8 +74,7 @@ Responde SOLO con el tipo más apropiado y una breve justificación en formato J
     "justification": "Breve explicación de por qué este tipo es el más apropiado"
 }}
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 POST_CLASSIFIER_TEMPLATE_EN = """
@@ -112,10 +96,18 @@ Respond ONLY with the most appropriate type and brief justification in JSON form
     "justification": "Brief explanation of why this type is most appropriate"
 }}
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== BRAND VOICE AGENT ==========
+# Esquema JSON común a ambos idiomas
+_BRAND_VOICE_JSON_SCHEMA = """{{
+    "tone": "string",
+    "personality": "string",
+    "style": "string", 
+    "values": ["string"],
+    "language_level": "string"
+}}"""
+
 # Versión en español
 BRAND_VOICE_TEMPLATE_ES = """
 Basándote en el análisis del prompt, define la voz de marca:
@@ -131,16 +123,9 @@ Define la voz de marca considerando:
 5. NIVEL DE LENGUAJE: Formal, casual, técnico
 
 Responde en formato JSON:
-{{
-    "tone": "string",
-    "personality": "string",
-    "style": "string", 
-    "values": ["string"],
-    "language_level": "string"
-}}
+""" + _BRAND_VOICE_JSON_SCHEMA + """
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 BRAND_VOICE_TEMPLATE_EN = """
@@ -157,16 +142,9 @@ Define the brand voice considering:
 5. LANGUAGE LEVEL: Formal, casual, technical
 
 Respond in JSON format:
-{{
-    "tone": "string",
-    "personality": "string",
-    "style": "string", 
-    "values": ["string"],
-    "language_level": "string"
-}}
+""" + _BRAND_VOICE_JSON_SCHEMA + """
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== FACT GROUNDING ==========
 # Versión en español
@@ -190,8 +168,7 @@ Responde en formato JSON:
     "verification_status": "string"
 }}
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 FACT_GROUNDING_TEMPLATE_EN = """
@@ -214,8 +191,7 @@ Respond in JSON format:
     "verification_status": "string"
 }}
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== TEXT GENERATOR ==========
 # Versión en español
@@ -257,6 +233,15 @@ Generate the main post content. Respond ONLY with the post text, no additional f
 """
 
 # ========== CAPTION CREATOR ==========
+# Esquema JSON común a ambos idiomas
+_CAPTION_CREATOR_JSON_SCHEMA = """{{
+    "caption": "string",
+    "call_to_action": "string",
+    "hashtags": ["string"],
+    "engagement_hooks": ["string"],
+    "questions": ["string"]
+}}"""
+
 # Versión en español
 CAPTION_CREATOR_TEMPLATE_ES = """
 Crea elementos de engagement para el post:
@@ -274,16 +259,9 @@ Crea:
 5. PREGUNTAS: Preguntas para interacción
 
 Responde en formato JSON:
-{{
-    "caption": "string",
-    "call_to_action": "string",
-    "hashtags": ["string"],
-    "engagement_hooks": ["string"],
-    "questions": ["string"]
-}}
+""" + _CAPTION_CREATOR_JSON_SCHEMA + """
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 CAPTION_CREATOR_TEMPLATE_EN = """
@@ -302,18 +280,21 @@ Create:
 5. QUESTIONS: Questions for interaction
 
 Respond in JSON format:
-{{
-    "caption": "string",
-    "call_to_action": "string",
-    "hashtags": ["string"],
-    "engagement_hooks": ["string"],
-    "questions": ["string"]
-}}
+""" + _CAPTION_CREATOR_JSON_SCHEMA + """
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== VISUAL CONCEPT ==========
+# Esquema JSON común a ambos idiomas
+_VISUAL_CONCEPT_JSON_SCHEMA = """{{
+    "mood": "string",
+    "color_palette": ["string"],
+    "imagery_type": "string",
+    "layout_style": "string",
+    "visual_elements": ["string"],
+    "design_notes": "string"
+}}"""
+
 # Versión en español
 VISUAL_CONCEPT_TEMPLATE_ES = """
 Genera un concepto visual detallado para el diseñador:
@@ -332,17 +313,9 @@ Define:
 6. NOTAS: Instrucciones para el diseñador
 
 Responde en formato JSON:
-{{
-    "mood": "string",
-    "color_palette": ["string"],
-    "imagery_type": "string",
-    "layout_style": "string",
-    "visual_elements": ["string"],
-    "design_notes": "string"
-}}
+""" + _VISUAL_CONCEPT_JSON_SCHEMA + """
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 VISUAL_CONCEPT_TEMPLATE_EN = """
@@ -362,17 +335,9 @@ Define:
 6. NOTES: Instructions for the designer
 
 Respond in JSON format:
-{{
-    "mood": "string",
-    "color_palette": ["string"],
-    "imagery_type": "string",
-    "layout_style": "string",
-    "visual_elements": ["string"],
-    "design_notes": "string"
-}}
+""" + _VISUAL_CONCEPT_JSON_SCHEMA + """
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== REASONING MODULE ==========
 # Versión en español
@@ -398,8 +363,7 @@ Responde en formato JSON:
     "risk_assessment": "string"
 }}
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 REASONING_MODULE_TEMPLATE_EN = """
@@ -424,8 +388,7 @@ Respond in JSON format:
     "risk_assessment": "string"
 }}
 
-IMPORTANT: Only respond with the JSON, no additional text.
-"""
+""" + _JSON_ONLY_FOOTER_EN
 
 # ========== HELPER FUNCTIONS ==========
 def get_prompt_template(base_name: str, language: str = "es"):
@@ -439,17 +402,125 @@ def get_prompt_template(base_name: str, language: str = "es"):
     Returns:
         Template de prompt en el idioma especificado
     """
-    template_name = f"{base_name}_TEMPLATE_{language.upper()}"
-    return globals().get(template_name, globals().get(f"{base_name}_TEMPLATE_ES"))
+    templates = PROMPT_TEMPLATES.get(base_name)
+    if templates is None:
+        return None
+    return templates.get(language.lower(), templates["es"])
+
+@functools.lru_cache(maxsize=64)
+def compile_prompt_template(base_name: str, language: str = "es") -> Callable[..., str]:
+    """
+    Devuelve una función que renderiza el template sin volver a parsearlo
+    
+    El template se descompone una sola vez en pares (literal, campo); cada
+    llamada solo concatena los literales con los valores recibidos. El
+    resultado es idéntico a `template.format(**fields)`.
+    
+    Args:
+        base_name: Nombre base del template (ej: "TEXT_GENERATOR")
+        language: Idioma ("es" o "en")
+    
+    Returns:
+        Función `render(**fields) -> str`
+    """
+    template = get_prompt_template(base_name, language)
+    parts = tuple(Formatter().parse(template))
+    
+    # Campos con conversión (!r) o nombres compuestos (a.b, a[0]): usar format directamente
+    if any(conversion or (field and not field.isidentifier()) for _, field, _, conversion in parts):
+        return template.format
+    
+    def render(**fields) -> str:
+        return "".join([
+            literal + (format(fields[field], spec) if field is not None else "")
+            for literal, field, spec, _ in parts
+        ])
+    
+    return render
+
+def render_prompt(base_name: str, language: str = "es", **fields) -> str:
+    """
+    Renderiza un template con su versión precompilada
+    
+    Args:
+        base_name: Nombre base del template (ej: "BRAND_VOICE")
+        language: Idioma ("es" o "en")
+        **fields: Valores de los campos del template
+    
+    Returns:
+        Prompt renderizado, idéntico a `template.format(**fields)`
+    """
+    renderers = PROMPT_RENDERERS.get(base_name)
+    if renderers is None:
+        return compile_prompt_template(base_name, language)(**fields)
+    return renderers.get(language.lower(), renderers["es"])(**fields)
+
+# ========== CONTEXTO COMPARTIDO ==========
+# Prefijo estable común a los agentes de contenido. Se envía como system prompt para
+# que sea el inicio byte a byte idéntico de cada petición y el proveedor pueda
+# reutilizar su prefill (prompt caching) entre TextGenerator, VisualConcept y VideoScripter
+SHARED_CONTEXT_TEMPLATE_ES = """Eres parte de un equipo que crea un post de marketing. Contexto común de la campaña:
+TIPO DE POST: {post_type}
+OBJETIVO: {objective}
+AUDIENCIA: {audience}
+VOZ DE MARCA: {brand_voice}"""
+
+SHARED_CONTEXT_TEMPLATE_EN = """You are part of a team creating a marketing post. Shared campaign context:
+POST TYPE: {post_type}
+OBJECTIVE: {objective}
+AUDIENCE: {audience}
+BRAND VOICE: {brand_voice}"""
+
+def _field(obj, name):
+    """Lee un campo de un modelo o de un diccionario"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+@functools.lru_cache(maxsize=256)
+def _shared_context(language: str, post_type, objective, audience, tone, personality, style, language_level) -> str:
+    """Renderiza el bloque de contexto compartido (memoizado)"""
+    brand_voice = ", ".join(str(value) for value in (tone, personality, style, language_level) if value)
+    return get_prompt_template("SHARED_CONTEXT", language).format(
+        post_type=post_type or "-",
+        objective=objective or "-",
+        audience=audience or "-",
+        brand_voice=brand_voice or "-"
+    )
+
+def shared_context_block(state) -> str:
+    """
+    Construye el prefijo de contexto compartido por los agentes de contenido
+    
+    Args:
+        state: Estado del workflow (diccionario)
+    
+    Returns:
+        Bloque idéntico para todas las llamadas con el mismo estado
+    """
+    language = (state.get("language_config") or {}).get("language", "es")
+    post_type = state.get("post_type")
+    analysis = state.get("prompt_analysis")
+    brand_voice = state.get("brand_voice")
+    return _shared_context(
+        language,
+        getattr(post_type, "value", post_type),
+        _field(analysis, "objective"),
+        _field(analysis, "audience"),
+        _field(brand_voice, "tone"),
+        _field(brand_voice, "personality"),
+        _field(brand_voice, "style"),
+        _field(brand_voice, "language_level")
+    )
 
 # ========== VISUAL FORMAT RECOMMENDER ==========
 # Versión en español
+# Las instrucciones fijas van primero y los datos variables al final, para que el
+# prefijo del prompt sea idéntico entre llamadas y el proveedor pueda cachearlo
 VISUAL_FORMAT_RECOMMENDER_TEMPLATE_ES = """
-Recomienda el formato visual más efectivo para este contenido:
-
-ANÁLISIS: {analysis}
-TIPO DE POST: {post_type}
-PLATAFORMA: {platform}
+Recomienda el formato visual más efectivo para el contenido descrito al final.
 
 Evalúa y recomienda entre:
 1. IMAGE: Imagen estática
@@ -473,16 +544,15 @@ Responde en formato JSON:
     "alternative_formats": ["string"]
 }}
 
-IMPORTANTE: Solo responde con el JSON, sin texto adicional.
-"""
+ANÁLISIS: {analysis}
+TIPO DE POST: {post_type}
+PLATAFORMA: {platform}
+
+""" + _JSON_ONLY_FOOTER_ES
 
 # Versión en inglés
 VISUAL_FORMAT_RECOMMENDER_TEMPLATE_EN = """
-Recommend the most effective visual format for this content:
-
-ANALYSIS: {analysis}
-POST TYPE: {post_type}
-PLATFORM: {platform}
+Recommend the most effective visual format for the content described at the end.
 
 Evaluate and recommend between:
 1. VIDEO: Short video/reel (highest engagement)
@@ -508,6 +578,10 @@ Respond in JSON format:
     "alternative_formats": ["string"]
 }}
 
+ANALYSIS: {analysis}
+POST TYPE: {post_type}
+PLATFORM: {platform}
+
 IMPORTANT: Only respond with the JSON, no additional text. All text must be in English.
 """
 
@@ -590,6 +664,83 @@ Respond in JSON format:
 IMPORTANT: All content must be in English only.
 """
 
+# ========== FUSED CONTENT ==========
+# Esquema JSON común a ambos idiomas
+_FUSED_CONTENT_JSON_SCHEMA = """{{
+    "core_content": "string",
+    "visual_concept": {{
+        "mood": "string",
+        "color_palette": ["string"],
+        "imagery_type": "string",
+        "layout_style": "string",
+        "visual_elements": ["string"],
+        "design_notes": "string"
+    }}{video_schema}
+}}"""
+
+# Versión en español
+FUSED_CONTENT_TEMPLATE_ES = """
+Genera en una sola respuesta el contenido de un post de marketing y sus piezas de producción:
+
+ANÁLISIS: {analysis}
+TIPO: {post_type}
+VOZ DE MARCA: {brand_voice}
+HECHOS: {facts}
+OBJETIVO: {objective}
+PLATAFORMA: {platform}
+FORMATO RECOMENDADO: {visual_format}
+
+1. CORE_CONTENT: Texto principal del post, coherente con la voz de marca, basado en los hechos y con longitud apropiada para redes sociales (sin formato markdown)
+2. VISUAL_CONCEPT: Concepto visual para el diseñador (mood, paleta, tipo de imagen, layout, elementos, notas)
+{video_section}
+Responde en formato JSON con estas claves:
+""" + _FUSED_CONTENT_JSON_SCHEMA + """
+
+""" + _JSON_ONLY_FOOTER_ES
+
+# Versión en inglés
+FUSED_CONTENT_TEMPLATE_EN = """
+Generate, in a single response, the content of a marketing post and its production pieces:
+
+ANALYSIS: {analysis}
+TYPE: {post_type}
+BRAND VOICE: {brand_voice}
+FACTS: {facts}
+OBJECTIVE: {objective}
+PLATFORM: {platform}
+RECOMMENDED FORMAT: {visual_format}
+
+1. CORE_CONTENT: Main post text, aligned with the brand voice, based on the facts and with a length appropriate for social media (no markdown formatting)
+2. VISUAL_CONCEPT: Visual concept for the designer (mood, palette, imagery type, layout, elements, notes)
+{video_section}
+Respond in JSON format with these keys:
+""" + _FUSED_CONTENT_JSON_SCHEMA + """
+
+IMPORTANT: Only respond with the JSON, no additional text. All content must be in English.
+"""
+
+# Sección de video del template fusionado (solo para formatos de video)
+FUSED_VIDEO_SECTION = {
+    "es": "3. VIDEO_SCRIPT: Script de video corto de {duration} (hook, setup, contenido, CTA) con narración e indicaciones visuales por segmento\n",
+    "en": "3. VIDEO_SCRIPT: Short-form video script of {duration} (hook, setup, content, CTA) with narration and visual directions per segment\n"
+}
+
+FUSED_VIDEO_SCHEMA = """,
+    "video_script": {
+        "script_segments": [
+            {
+                "segment": "hook/setup/content/cta",
+                "duration": "0-3s",
+                "narration": "string",
+                "visual_direction": "string",
+                "text_overlay": "string"
+            }
+        ],
+        "engagement_elements": ["string"],
+        "music_style": "string",
+        "hashtags": ["string"]
+    }"""
+
 # ========== RESULT OPTIMIZER ==========
 # Versión en español
 RESULT_OPTIMIZER_TEMPLATE_ES = """
@@ -728,8 +879,8 @@ Respond in JSON format:
 IMPORTANT: Focus on actionable, time-sensitive insights. All content must be in English.
 """
 
-# Mapeo de templates por agente
-AGENT_TEMPLATES = {
+# Mapeo de templates por agente (solo lectura)
+AGENT_TEMPLATES: Final[Mapping[str, str]] = MappingProxyType({
     "prompt_analyzer": "PROMPT_ANALYZER",
     "post_classifier": "POST_CLASSIFIER", 
     "brand_voice": "BRAND_VOICE",
@@ -740,17 +891,26 @@ AGENT_TEMPLATES = {
     "reasoning_module": "REASONING_MODULE",
     "visual_format_recommender": "VISUAL_FORMAT_RECOMMENDER",
     "video_scripter": "VIDEO_SCRIPTER",
+    "fused_content": "FUSED_CONTENT",
     "result_optimizer": "RESULT_OPTIMIZER",
     "contextual_awareness": "CONTEXTUAL_AWARENESS"
-}
-
-# Prompt para validación de JSON
-JSON_VALIDATION_TEMPLATE = """
-Valida que la siguiente respuesta sea un JSON válido y esté en el formato correcto:
-
-RESPUESTA: {response}
-
-Si es JSON válido, responde con "VALID". Si no, responde con "INVALID" y explica el error.
-
-IMPORTANTE: Solo responde con "VALID" o "INVALID: [explicación del error]".
-"""
+})
+
+# Templates por nombre base e idioma, resueltos una sola vez al importar
+# (agentes y bloques auxiliares como SHARED_CONTEXT)
+PROMPT_TEMPLATES: Final[Mapping[str, Mapping[str, str]]] = MappingProxyType({
+    name[:-len("_TEMPLATE_ES")]: MappingProxyType({
+        "es": template,
+        "en": globals().get(name[:-len("ES")] + "EN", template),
+    })
+    for name, template in list(globals().items())
+    if name.endswith("_TEMPLATE_ES")
+})
+
+# Funciones de renderizado de cada template, compiladas al importar
+PROMPT_RENDERERS: Final[Mapping[str, Mapping[str, Callable[..., str]]]] = MappingProxyType({
+    base_name: MappingProxyType({
+        language: compile_prompt_template(base_name, language) for language in templates
+    })
+    for base_name, templates in PROMPT_TEMPLATES.items()
+})
@@ -1,23 +1,22 @@
-import os
-from typing import Optional
-try:
-    from pydantic_settings import BaseSettings
-except ImportError:
-    from pydantic import BaseSettings
+import functools
+from typing import FrozenSet, NamedTuple, Optional
+
+from pydantic import SecretStr
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     """Configuraciones del sistema de marketing"""
     
-    # APIs principales
-    google_api_key: Optional[str] = None
+    # APIs principales (claves como SecretStr: no aparecen en repr ni en logs)
+    google_api_key: Optional[SecretStr] = None
     google_model: str = "gemini-1.5-flash"
-    groq_api_key: Optional[str] = None
+    groq_api_key: Optional[SecretStr] = None
     groq_model: str = "llama-3.1-70b-versatile"
     
     # APIs opcionales
-    openai_api_key: Optional[str] = None
+    openai_api_key: Optional[SecretStr] = None
     openai_model: str = "gpt-4o-mini"
-    anthropic_api_key: Optional[str] = None
+    anthropic_api_key: Optional[SecretStr] = None
     anthropic_model: str = "claude-3-sonnet-20240229"
     
     # Configuración local
@@ -40,6 +39,15 @@ class Settings(BaseSettings):
     text_generator_model: str = "gemini"
     caption_creator_model: str = "groq"
     visual_concept_model: str = "gemini"
+    visual_format_recommender_model: str = "groq"
+    visual_format_recommender_groq_model: str = "llama-3.1-8b-instant"  # JSON corto: modelo rápido
+    
+    # Niveles de servicio de Gemini por agente ("priority" en la ruta crítica, "flex" en segundo plano)
+    gemini_service_tiers: bool = False  # Activar solo si la cuenta tiene acceso a estos niveles
+    gemini_priority_agents: FrozenSet[str] = frozenset(
+        {"visual_concept", "reasoning_module", "contextual_awareness", "prompt_analyzer"}
+    )
+    gemini_flex_agents: FrozenSet[str] = frozenset({"result_optimizer"})
     reasoning_module_model: str = "gemini"
     
     # Configuración del sistema
@@ -52,7 +60,9 @@ class Settings(BaseSettings):
     # Cache y performance
     enable_caching: bool = True
     cache_duration_hours: int = 24
+    llm_cache_path: Optional[str] = None  # Ruta de la caché en disco de respuestas LLM (desactivada si vacía)
     enable_parallel_processing: bool = True
+    batch_max_concurrency: int = 4  # Llamadas simultáneas en ejecuciones por lotes
     
     # Logging
     log_level: str = "INFO"
@@ -74,22 +84,52 @@ class Settings(BaseSettings):
     # Para compatibilidad
     llm_provider: str = "google_ai"
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
+    # Solo lectura tras construirse; se ignoran variables del .env que no son campos
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        case_sensitive=False,
+        extra="ignore",
+        frozen=True
+    )
 
-# Instancia global de configuración
-settings = Settings()
+class HotSettings(NamedTuple):
+    """Valores de configuración leídos en cada llamada al LLM"""
+    timeout_seconds: int
+    max_tokens: int
+    temperature: float
+    max_retries: int
+    enable_caching: bool
 
-def get_settings():
-    """Función para obtener la configuración global"""
-    class SettingsWrapper:
-        def __init__(self, settings):
-            self.__dict__.update(settings.__dict__)
-            
-        def getLogger(self, name):
-            import logging
-            return logging.getLogger(name)
-    
-    return SettingsWrapper(settings)
+@functools.lru_cache(maxsize=1)
+def _load_settings() -> Settings:
+    """Construye la configuración (lee .env y el entorno) una sola vez por proceso"""
+    return Settings()
+
+@functools.lru_cache(maxsize=1)
+def get_hot_settings() -> HotSettings:
+    """Copia inmutable de los valores de uso frecuente, para leerlos sin pasar por Settings"""
+    current = _load_settings()
+    return HotSettings(*(getattr(current, field) for field in HotSettings._fields))
+
+@functools.lru_cache(maxsize=None)
+def gemini_service_tier(agent_name: str) -> Optional[str]:
+    """Nivel de servicio de Gemini para un agente, o None para el nivel estándar"""
+    current = _load_settings()
+    if not current.gemini_service_tiers:
+        return None
+    if agent_name in current.gemini_priority_agents:
+        return "priority"
+    if agent_name in current.gemini_flex_agents:
+        return "flex"
+    return None
+
+def __getattr__(name: str):
+    # Instancia global `settings`, creada en el primer acceso y no al importar
+    if name == "settings":
+        return _load_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
+def get_settings() -> Settings:
+    """Función para obtener la configuración global (instancia única, inmutable)"""
+    return _load_settings()
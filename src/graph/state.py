@@ -1,9 +1,12 @@
 """
 Estado del workflow de marketing para LangGraph
 """
-from typing import Dict, Any, List, Optional
+import operator
+import re
+import time
+from typing import Annotated, Dict, Any, List, Optional
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from src.models.content_brief import (
     PromptAnalysis, PostType, BrandVoice,
@@ -60,27 +63,37 @@ class WorkflowState(BaseModel):
     # Metadatos del procesamiento
     processing_start: Optional[datetime] = Field(default=None, description="Inicio del procesamiento")
     processing_end: Optional[datetime] = Field(default=None, description="Fin del procesamiento")
+    processing_start_perf: Optional[float] = Field(
+        default=None, exclude=True, description="Inicio del procesamiento según time.perf_counter()"
+    )
     
     # Tiempos por agente
     agent_timings: Dict[str, float] = Field(default_factory=dict, description="Tiempos de procesamiento por agente")
     
     # Control del workflow
+    # Los campos acumulativos usan operator.add como reducer: cada nodo devuelve solo las entradas nuevas
     current_step: str = Field(default="initialize", description="Paso actual del workflow")
-    completed_steps: List[str] = Field(default_factory=list, description="Pasos completados")
+    completed_steps: Annotated[List[str], operator.add] = Field(default_factory=list, description="Pasos completados")
     
     # Manejo de errores
-    errors: List[str] = Field(default_factory=list, description="Lista de errores")
-    warnings: List[str] = Field(default_factory=list, description="Lista de advertencias")
+    errors: Annotated[List[str], operator.add] = Field(default_factory=list, description="Lista de errores")
+    warnings: Annotated[List[str], operator.add] = Field(default_factory=list, description="Lista de advertencias")
     
     # Estado del workflow
     is_complete: bool = Field(default=False, description="Indica si el workflow está completo")
     is_error: bool = Field(default=False, description="Indica si hubo errores críticos")
     
-    class Config:
-        arbitrary_types_allowed = True
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
+    # Sin json_encoders: pydantic-core ya serializa datetime a ISO 8601 sin pasar por Python
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+def state_field(value, key: str, default: Any = None) -> Any:
+    """
+    Lee un campo de un modelo Pydantic del estado o de un diccionario sin volcar
+    el modelo completo. None se trata como un valor sin campos
+    """
+    if isinstance(value, dict):
+        return value.get(key, default)
+    return getattr(value, key, default)
 
 def create_initial_state(input_prompt: str) -> WorkflowState:
     """Crea el estado inicial del workflow"""
@@ -90,34 +103,56 @@ def create_initial_state(input_prompt: str) -> WorkflowState:
     return WorkflowState(
         input_prompt=input_prompt,
         processing_start=datetime.now(),
+        processing_start_perf=time.perf_counter(),
         current_step="initialize",
         language_config={"language": language}
     )
 
+# Palabras clave para detectar el idioma del prompt
+# Palabras claramente en español
+_SPANISH_KEYWORDS = frozenset((
+    "crear", "generar", "escribir", "hacer", "desarrollar", "construir", "diseñar",
+    "campaña", "contenido", "redes", "sociales", "marca", "producto", "servicio",
+    "empresa", "negocio", "cliente", "audiencia", "estrategia", "promoción",
+    "publicidad", "para", "con", "una", "del", "las", "los", "que", "como"
+))
+
+# Palabras claramente en inglés
+_ENGLISH_KEYWORDS = frozenset((
+    "create", "generate", "write", "make", "develop", "build", "design",
+    "marketing", "campaign", "post", "content", "social", "media",
+    "brand", "product", "service", "company", "business", "customer",
+    "audience", "engagement", "strategy", "promotion", "advertisement",
+    "for", "with", "the", "and", "our", "new", "launch", "targeting"
+))
+
+# Palabras del prompt (incluye tildes, ñ y ü)
+_WORD_RE = re.compile(r"[a-záéíóúñü]+")
+
+# Diferencia de palabras clave a partir de la cual el idioma ya está decidido
+_LANGUAGE_DECISION_GAP = 3
+
 def _is_english_prompt(prompt: str) -> bool:
     """Detecta si un prompt está en inglés basado en palabras clave"""
-    # Palabras claramente en español
-    spanish_keywords = [
-        "crear", "generar", "escribir", "hacer", "desarrollar", "construir", "diseñar",
-        "campaña", "contenido", "redes", "sociales", "marca", "producto", "servicio",
-        "empresa", "negocio", "cliente", "audiencia", "estrategia", "promoción",
-        "publicidad", "para", "con", "una", "del", "las", "los", "que", "como"
-    ]
-    
-    # Palabras claramente en inglés
-    english_keywords = [
-        "create", "generate", "write", "make", "develop", "build", "design",
-        "marketing", "campaign", "post", "content", "social", "media",
-        "brand", "product", "service", "company", "business", "customer",
-        "audience", "engagement", "strategy", "promotion", "advertisement",
-        "for", "with", "the", "and", "our", "new", "launch", "targeting"
-    ]
-    
-    prompt_lower = prompt.lower()
-    
-    # Contar palabras en español e inglés
-    spanish_count = sum(1 for word in spanish_keywords if word in prompt_lower)
-    english_count = sum(1 for word in english_keywords if word in prompt_lower)
+    # Contar palabras clave distintas en español e inglés (palabras completas),
+    # dejando de leer el prompt en cuanto un idioma saca ventaja clara
+    seen = set()
+    spanish_count = english_count = 0
+    for match in _WORD_RE.finditer(prompt.lower()):
+        word = match.group()
+        if word in seen:
+            continue
+        seen.add(word)
+        
+        if word in _SPANISH_KEYWORDS:
+            spanish_count += 1
+        elif word in _ENGLISH_KEYWORDS:
+            english_count += 1
+        else:
+            continue
+        
+        if abs(spanish_count - english_count) >= _LANGUAGE_DECISION_GAP:
+            break
     
     # Si hay más palabras en español, es español
     if spanish_count > english_count:
@@ -188,14 +223,26 @@ def update_state_with_reasoning(state: WorkflowState, reasoning: ReasoningModule
     return state
 
 def update_state_with_visual_format(state: WorkflowState, visual_format: Dict[str, Any]) -> WorkflowState:
-    """Actualiza el estado con la recomendación de formato visual"""
+    """Actualiza el estado con la recomendación de formato visual (modelo o diccionario, en el sitio)"""
+    if isinstance(state, dict):
+        state["visual_format_recommendation"] = visual_format
+        state.setdefault("completed_steps", []).append("visual_format_recommendation")
+        state["current_step"] = "video_script"
+        return state
+    
     state.visual_format_recommendation = visual_format
     state.completed_steps.append("visual_format_recommendation")
     state.current_step = "video_script"
     return state
 
 def update_state_with_video_script(state: WorkflowState, video_script: Dict[str, Any]) -> WorkflowState:
-    """Actualiza el estado con el script de video"""
+    """Actualiza el estado con el script de video (modelo o diccionario, en el sitio)"""
+    if isinstance(state, dict):
+        state["video_script"] = video_script
+        state.setdefault("completed_steps", []).append("video_script")
+        state["current_step"] = "result_optimization"
+        return state
+    
     state.video_script = video_script
     state.completed_steps.append("video_script")
     state.current_step = "result_optimization"
@@ -209,28 +256,49 @@ def update_state_with_optimization(state: WorkflowState, optimizations: Dict[str
     return state
 
 def update_state_with_context(state: WorkflowState, context: Dict[str, Any]) -> WorkflowState:
-    """Actualiza el estado con la conciencia contextual"""
+    """Actualiza el estado con la conciencia contextual (modelo o diccionario, en el sitio)"""
+    if isinstance(state, dict):
+        state["contextual_awareness"] = context
+        state.setdefault("completed_steps", []).append("contextual_awareness")
+        state["current_step"] = "final_assembly"
+        return state
+    
     state.contextual_awareness = context
     state.completed_steps.append("contextual_awareness")
     state.current_step = "final_assembly"
     return state
 
+def elapsed_seconds(state: WorkflowState) -> float:
+    """
+    Tiempo total de procesamiento. Usa el reloj monotónico de alta resolución;
+    las fechas de inicio y fin solo quedan como referencia legible
+    """
+    if state.processing_start_perf is not None:
+        return time.perf_counter() - state.processing_start_perf
+    if state.processing_start and state.processing_end:
+        return (state.processing_end - state.processing_start).total_seconds()
+    return 0.0
+
 def finalize_state(state: WorkflowState) -> WorkflowState:
     """Finaliza el estado del workflow"""
     state.processing_end = datetime.now()
     state.is_complete = True
     state.current_step = "complete"
     
-    # Crear el brief final
-    if all([
-        state.post_type, state.core_content, state.engagement_elements,
-        state.visual_concept, state.brand_voice, state.factual_grounding, state.reasoning
-    ]):
-        # Calcular tiempo total
-        if state.processing_start and state.processing_end:
-            total_time = (state.processing_end - state.processing_start).total_seconds()
-        else:
-            total_time = 0.0
+    # Crear el brief final solo si tenemos todos los componentes necesarios
+    components = (
+        ("post_type", state.post_type),
+        ("core_content", state.core_content),
+        ("engagement_elements", state.engagement_elements),
+        ("visual_concept", state.visual_concept),
+        ("brand_voice", state.brand_voice),
+        ("factual_grounding", state.factual_grounding),
+        ("reasoning", state.reasoning),
+    )
+    missing = [name for name, value in components if not value]
+    
+    if not missing:
+        total_time = elapsed_seconds(state)
         
         # Crear metadatos
         metadata = ProcessingMetadata(
@@ -239,51 +307,36 @@ def finalize_state(state: WorkflowState) -> WorkflowState:
             timestamp=(state.processing_end.isoformat() if state.processing_end else datetime.now().isoformat()),
         )
         
-        # Crear brief final solo si tenemos todos los componentes necesarios
         try:
-            if (state.post_type and state.core_content and 
-                state.engagement_elements and state.visual_concept and 
-                state.brand_voice and state.factual_grounding and state.reasoning):
-                
-                state.final_brief = ContentBrief(
-                    post_type=state.post_type,
-                    core_content=state.core_content,
-                    prompt_analysis=state.prompt_analysis if state.prompt_analysis else PromptAnalysis(
-                        objective="",
-                        audience="",
-                        brand_cues=[],
-                        key_facts=[],
-                        urgency=None,
-                        platform=None,
-                        tone_indicators=[],
-                        content_goals=[]
-                    ),
-                    engagement_elements=state.engagement_elements,
-                    visual_concept=state.visual_concept,
-                    brand_voice=state.brand_voice,
-                    factual_grounding=state.factual_grounding,
-                    reasoning=state.reasoning,
-                    metadata=metadata
-                )
-            else:
-                # Log qué componentes faltan
-                missing = []
-                if not state.post_type: missing.append("post_type")
-                if not state.core_content: missing.append("core_content")
-                if not state.engagement_elements: missing.append("engagement_elements")
-                if not state.visual_concept: missing.append("visual_concept")
-                if not state.brand_voice: missing.append("brand_voice")
-                if not state.factual_grounding: missing.append("factual_grounding")
-                if not state.reasoning: missing.append("reasoning")
-                
-                error_msg = f"No se puede crear brief final. Componentes faltantes: {', '.join(missing)}"
-                state.errors.append(error_msg)
-                state.final_brief = None
-                
+            state.final_brief = ContentBrief(
+                post_type=state.post_type,
+                core_content=state.core_content,
+                prompt_analysis=state.prompt_analysis if state.prompt_analysis else PromptAnalysis(
+                    objective="",
+                    audience="",
+                    brand_cues=[],
+                    key_facts=[],
+                    urgency=None,
+                    platform=None,
+                    tone_indicators=[],
+                    content_goals=[]
+                ),
+                engagement_elements=state.engagement_elements,
+                visual_concept=state.visual_concept,
+                brand_voice=state.brand_voice,
+                factual_grounding=state.factual_grounding,
+                reasoning=state.reasoning,
+                metadata=metadata
+            )
         except Exception as e:
             error_msg = f"Error creando brief final: {str(e)}"
             state.errors.append(error_msg)
             state.final_brief = None
+    else:
+        # Registrar qué componentes faltan
+        error_msg = f"No se puede crear brief final. Componentes faltantes: {', '.join(missing)}"
+        state.errors.append(error_msg)
+        state.final_brief = None
     
     return state
 
@@ -1,6 +1,7 @@
 """
 Workflow de LangGraph para el sistema de marketing
 """
+import asyncio
 import logging
 import time
 from typing import Dict, Any
@@ -10,7 +11,7 @@ from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 
 from src.models.content_brief import ContentBrief, ProcessingMetadata
-from src.graph.state import WorkflowState, finalize_state
+from src.graph.state import WorkflowState, elapsed_seconds, finalize_state
 from src.agents.prompt_analyzer import PromptAnalyzer
 from src.agents.post_classifier import PostClassifier
 from src.agents.brand_voice_agent import BrandVoiceAgent
@@ -21,22 +22,99 @@ from src.agents.visual_concept import VisualConceptAgent
 from src.agents.reasoning_module import ReasoningModuleAgent
 from src.agents.visual_format_recommender import VisualFormatRecommender
 from src.agents.video_scripter import VideoScripter
+from src.agents.fused_content import FusedContentAgent
 from src.agents.result_optimizer import ResultOptimizer
 from src.agents.contextual_awareness import ContextualAwarenessEngine
 from src.tools.llm_client import create_llm_client
+from src.tools.batching_proxy import BatchingLLMProxy
+from src.config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Respuestas LLM guardadas en memoria por el proxy de agrupación
+_LLM_CACHE_MAX_ENTRIES = 512
+
+# Campos acumulativos del estado que cada rama paralela debe recibir como copia propia
+_APPEND_FIELDS = ("completed_steps", "errors", "warnings")
+
+# Campo que produce cada agente paralelo; si ya existe (generación fusionada) el agente se omite
+_AGENT_OUTPUTS = {
+    "visual_concept": "visual_concept",
+    "video_scripter": "video_script"
+}
+
+def _state_fields(state) -> Dict[str, Any]:
+    """
+    Diccionario de campos del estado sin copiar ni serializar los modelos anidados.
+    LangGraph construye un WorkflowState nuevo (con listas propias) para cada nodo
+    """
+    if isinstance(state, dict):
+        return state
+    return dict(state)
+
+def _branch_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia superficial del estado con contenedores mutables propios para una rama"""
+    branch = dict(state)
+    for field in _APPEND_FIELDS:
+        branch[field] = list(state.get(field) or [])
+    branch["agent_timings"] = dict(state.get("agent_timings") or {})
+    return branch
+
+def _state_delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Actualización para LangGraph con solo los campos que ha cambiado un nodo.
+    De los campos acumulativos se envían las entradas nuevas (el reducer las concatena);
+    los diccionarios se envían siempre porque pueden haberse modificado en sitio
+    """
+    delta = {}
+    for key, value in after.items():
+        if key in _APPEND_FIELDS:
+            added = value[len(before.get(key) or []):]
+            if added:
+                delta[key] = added
+        elif value is not before.get(key) or isinstance(value, dict):
+            delta[key] = value
+    return delta
+
+def _merge_branch_states(base: Dict[str, Any], results: list) -> Dict[str, Any]:
+    """
+    Fusiona los estados devueltos por agentes ejecutados en paralelo.
+    Los campos acumulativos se concatenan; el resto se toma de la rama que lo modificó
+    """
+    merged = _branch_state(base)
+    for result in results:
+        for key, value in result.items():
+            if key in _APPEND_FIELDS:
+                merged[key].extend(value[len(base.get(key) or []):])
+            elif key == "agent_timings":
+                merged[key].update(value)
+            elif value != base.get(key):
+                merged[key] = value
+    return merged
+
 class MarketingWorkflow:
     """
     Workflow principal del sistema de marketing usando LangGraph
     """
     
-    def __init__(self, use_realtime_data: bool = False, enable_rag: bool = True):
+    def __init__(self, use_realtime_data: bool = False, enable_rag: bool = True, use_fused_content: bool = False):
         self.llm_client = create_llm_client()
+        # Cliente compartido de los agentes de contenido (caché de respuestas; agrupación solo
+        # con endpoint batch). Las respuestas repetidas se sirven desde caché según la configuración
+        settings = get_settings()
+        self.batching_llm = BatchingLLMProxy(
+            self.llm_client,
+            cache_max_entries=_LLM_CACHE_MAX_ENTRIES if settings.enable_caching else 0,
+            cache_ttl_seconds=settings.cache_duration_hours * 3600,
+            cache_path=settings.llm_cache_path
+        )
         self.use_realtime_data = use_realtime_data
         self.enable_rag = enable_rag
+        self.use_fused_content = use_fused_content
+        # Validación completa del estado tras cada agente, solo en modo depuración
+        self.validate_state = settings.debug_mode
         self.agents = self._initialize_agents()
+        self._agent_names = tuple(self.agents)
         self.graph = self._create_workflow()
         
         logger.info(f"Workflow de marketing inicializado (real-time: {use_realtime_data}, RAG: {enable_rag})")
@@ -44,21 +122,37 @@ class MarketingWorkflow:
     def _wrap_agent_process(self, agent_name: str):
         """Envuelve el proceso del agente para manejar la conversión de estado"""
         async def wrapped_process(state):
-            # Convertir estado Pydantic a diccionario
-            if hasattr(state, 'model_dump'):
-                state_dict = state.model_dump()
-            elif hasattr(state, 'dict'):
-                state_dict = state.dict()
-            else:
-                state_dict = state
+            # Vista superficial del estado: los modelos anidados se pasan tal cual, sin serializarlos
+            state_dict = _state_fields(state)
             
-            # Ejecutar el agente
-            result = await self.agents[agent_name].process(state_dict)
+            # Ejecutar el agente sobre listas propias para poder separar lo que añade
+            result = _state_fields(await self.agents[agent_name].process(_branch_state(state_dict)))
             
-            # Convertir resultado de vuelta a WorkflowState
-            if isinstance(result, dict):
-                return WorkflowState(**result)
-            return result
+            # LangGraph aplica el diccionario como actualización de los canales y valida
+            # el estado al construir la entrada del siguiente nodo; no hace falta reconstruirlo aquí
+            if self.validate_state:
+                WorkflowState.model_validate(result)
+            return _state_delta(state_dict, result)
+        
+        return wrapped_process
+    
+    def _wrap_parallel_agents(self, *agent_names: str):
+        """Envuelve varios agentes independientes para ejecutarlos concurrentemente"""
+        async def wrapped_process(state):
+            state_dict = _state_fields(state)
+            
+            # Omitir agentes cuya salida ya generó la llamada fusionada
+            pending = [name for name in agent_names if not state_dict.get(_AGENT_OUTPUTS.get(name, ""))]
+            
+            # Cada agente trabaja sobre su propia copia para evitar carreras en listas y tiempos
+            results = await asyncio.gather(*(
+                self.agents[name].process(_branch_state(state_dict)) for name in pending
+            ))
+            
+            merged = _merge_branch_states(state_dict, [_state_fields(result) for result in results])
+            if self.validate_state:
+                WorkflowState.model_validate(merged)
+            return _state_delta(state_dict, merged)
         
         return wrapped_process
     
@@ -69,12 +163,13 @@ class MarketingWorkflow:
             "post_classifier": PostClassifier(self.llm_client),
             "brand_voice_agent": BrandVoiceAgent(self.llm_client),
             "fact_grounding": FactGroundingAgent(self.llm_client),
-            "text_generator": TextGenerator(self.llm_client),
-            "caption_creator": CaptionCreator(self.llm_client),
-            "visual_concept": VisualConceptAgent(self.llm_client),
+            "text_generator": TextGenerator(self.batching_llm),
+            "caption_creator": CaptionCreator(self.batching_llm),
+            "visual_concept": VisualConceptAgent(self.batching_llm),
             "reasoning_module": ReasoningModuleAgent(self.llm_client),
             "visual_format_recommender": VisualFormatRecommender(self.llm_client),
-            "video_scripter": VideoScripter(self.llm_client),
+            "video_scripter": VideoScripter(self.batching_llm),
+            "fused_content": FusedContentAgent(self.batching_llm),
             "result_optimizer": ResultOptimizer(self.llm_client, use_realtime_data=self.use_realtime_data, enable_rag=self.enable_rag),
             "contextual_awareness": ContextualAwarenessEngine(self.llm_client)
         }
@@ -89,14 +184,20 @@ class MarketingWorkflow:
         workflow.add_node("post_classifier_node", self._wrap_agent_process("post_classifier"))
         workflow.add_node("brand_voice_agent_node", self._wrap_agent_process("brand_voice_agent"))
         workflow.add_node("fact_grounding_node", self._wrap_agent_process("fact_grounding"))
-        workflow.add_node("text_generator_node", self._wrap_agent_process("text_generator"))
-        workflow.add_node("caption_creator_node", self._wrap_agent_process("caption_creator"))
-        workflow.add_node("visual_concept_node", self._wrap_agent_process("visual_concept"))
-        workflow.add_node("reasoning_module_node", self._wrap_agent_process("reasoning_module"))
         workflow.add_node("visual_format_recommender_node", self._wrap_agent_process("visual_format_recommender"))
-        workflow.add_node("video_scripter_node", self._wrap_agent_process("video_scripter"))
-        workflow.add_node("result_optimizer_node", self._wrap_agent_process("result_optimizer"))
-        workflow.add_node("contextual_awareness_node", self._wrap_agent_process("contextual_awareness"))
+        # Con generación fusionada, una sola llamada produce contenido, concepto visual y script
+        content_agent = "fused_content" if self.use_fused_content else "text_generator"
+        workflow.add_node("text_generator_node", self._wrap_agent_process(content_agent))
+        # Caption, concepto visual y script de video solo dependen del contenido principal
+        # y del formato recomendado, así que sus llamadas al LLM se solapan
+        workflow.add_node("content_assets_node", self._wrap_parallel_agents(
+            "caption_creator", "visual_concept", "video_scripter"
+        ))
+        # Razonamiento, optimización y contexto leen el contenido ya generado pero no
+        # las salidas de los demás, así que también se ejecutan a la vez
+        workflow.add_node("strategy_node", self._wrap_parallel_agents(
+            "reasoning_module", "result_optimizer", "contextual_awareness"
+        ))
         
         # Nodo para finalizar el workflow
         workflow.add_node("finalize", self._finalize_workflow)
@@ -108,15 +209,11 @@ class MarketingWorkflow:
         workflow.add_edge("prompt_analyzer_node", "post_classifier_node")
         workflow.add_edge("post_classifier_node", "brand_voice_agent_node")
         workflow.add_edge("brand_voice_agent_node", "fact_grounding_node")
-        workflow.add_edge("fact_grounding_node", "text_generator_node")
-        workflow.add_edge("text_generator_node", "caption_creator_node")
-        workflow.add_edge("caption_creator_node", "visual_concept_node")
-        workflow.add_edge("visual_concept_node", "reasoning_module_node")
-        workflow.add_edge("reasoning_module_node", "visual_format_recommender_node")
-        workflow.add_edge("visual_format_recommender_node", "video_scripter_node")
-        workflow.add_edge("video_scripter_node", "result_optimizer_node")
-        workflow.add_edge("result_optimizer_node", "contextual_awareness_node")
-        workflow.add_edge("contextual_awareness_node", "finalize")
+        workflow.add_edge("fact_grounding_node", "visual_format_recommender_node")
+        workflow.add_edge("visual_format_recommender_node", "text_generator_node")
+        workflow.add_edge("text_generator_node", "content_assets_node")
+        workflow.add_edge("content_assets_node", "strategy_node")
+        workflow.add_edge("strategy_node", "finalize")
         
         # Configurar el final del workflow
         workflow.add_edge("finalize", END)
@@ -137,42 +234,23 @@ class MarketingWorkflow:
         try:
             logger.info("Finalizando workflow y creando brief final")
             
-            # Finalizar el estado
+            # Finalizar el estado (se modifica en sitio, así que se guarda una copia para el delta)
+            before = _branch_state(_state_fields(state))
             final_state = finalize_state(state)
             
-            # Crear metadatos de procesamiento
-            if hasattr(final_state, 'processing_start') and final_state.processing_start and hasattr(final_state, 'processing_end') and final_state.processing_end:
-                total_time = (final_state.processing_end - final_state.processing_start).total_seconds()
-                
-                # Actualizar metadatos con información del modelo
-                if hasattr(final_state, 'final_brief') and final_state.final_brief and hasattr(final_state.final_brief, 'metadata') and final_state.final_brief.metadata:
-                    final_state.final_brief.metadata.processing_time = total_time
-                    final_state.final_brief.metadata.model_used = self.llm_client.__class__.__name__
-                    # El esquema minimal usa timestamp como string
-                    try:
-                        final_state.final_brief.metadata.timestamp = final_state.processing_end.isoformat()
-                    except Exception:
-                        final_state.final_brief.metadata.timestamp = str(final_state.processing_end)
-            
-            if 'total_time' in locals():
-                logger.info(f"Workflow completado en {total_time:.2f}s")
+            # finalize_state ya calcula el tiempo total; aquí se añade el modelo real
+            metadata = final_state.final_brief.metadata if final_state.final_brief else None
+            if metadata:
+                metadata.model_used = self.llm_client.__class__.__name__
+                logger.info(f"Workflow completado en {metadata.processing_time:.2f}s")
             else:
-                logger.info("Workflow completado")
-            return final_state
+                logger.info(f"Workflow completado en {elapsed_seconds(final_state):.2f}s")
+            return _state_delta(before, _state_fields(final_state))
             
         except Exception as e:
             logger.error(f"Error finalizando workflow: {e}")
-            if isinstance(state, dict):
-                if "errors" not in state:
-                    state["errors"] = []
-                state["errors"].append(f"[finalize]: {str(e)}")
-                state["is_error"] = True
-            else:
-                if hasattr(state, 'errors'):
-                    state.errors.append(f"[finalize]: {str(e)}")
-                if hasattr(state, 'is_error'):
-                    state.is_error = True
-            return state
+            # El reducer de LangGraph añade el error a los ya registrados
+            return {"errors": [f"[finalize]: {str(e)}"], "is_error": True}
     
     async def process_prompt(self, input_prompt: str, language_config: dict = None) -> Dict[str, Any]:
         """
@@ -203,16 +281,17 @@ class MarketingWorkflow:
             logger.info("Ejecutando workflow de LangGraph")
             final_state = await self.graph.ainvoke(initial_state)
             
-            # Verificar si hubo errores
-            if hasattr(final_state, 'is_error') and final_state.is_error:
+            # LangGraph devuelve los canales del estado como diccionario
+            if final_state.get("is_error"):
                 logger.error("Workflow completado con errores")
-                logger.error(f"Errores: {getattr(final_state, 'errors', [])}")
+                logger.error(f"Errores: {final_state.get('errors', [])}")
             else:
                 logger.info("Workflow completado exitosamente")
                 
                 # Log de métricas
-                if hasattr(final_state, 'final_brief') and final_state.final_brief and hasattr(final_state.final_brief, 'metadata') and final_state.final_brief.metadata:
-                    metadata = final_state.final_brief.metadata
+                final_brief = final_state.get("final_brief")
+                if final_brief and final_brief.metadata:
+                    metadata = final_brief.metadata
                     logger.info(f"Tiempo total: {metadata.processing_time:.2f}s")
                     logger.info(f"Modelo usado: {metadata.model_used}")
             
@@ -231,12 +310,22 @@ class MarketingWorkflow:
             )
             return error_state
     
+    async def aclose(self) -> None:
+        """
+        Libera los recursos ligados al event loop actual: conexiones HTTP del cliente LLM
+        y sesión de datos en tiempo real. Llamar antes de cerrar cada loop (p. ej. uno por
+        petición en Streamlit); el workflow sigue siendo usable en un loop nuevo
+        """
+        await self.agents["result_optimizer"].aclose()
+        await self.batching_llm.aclose()
+        await self.llm_client.aclose()
+    
     def get_workflow_status(self) -> Dict[str, Any]:
         """Obtiene el estado del workflow"""
         return {
             "status": "active",
-            "agents": list(self.agents.keys()),
-            "total_agents": len(self.agents),
+            "agents": self._agent_names,
+            "total_agents": len(self._agent_names),
             "llm_provider": self.llm_client.__class__.__name__
         }
     
@@ -252,19 +341,19 @@ class MarketingWorkflow:
         """
         try:
             logger.info("Ejecutando prueba del workflow")
-            start_time = datetime.now()
+            start_time = time.perf_counter()
             
-            result = await self.process_prompt(test_prompt)
+            # El resultado es el diccionario de LangGraph o un WorkflowState de error
+            result = _state_fields(await self.process_prompt(test_prompt))
             
-            end_time = datetime.now()
-            test_duration = (end_time - start_time).total_seconds()
+            test_duration = time.perf_counter() - start_time
             
             test_result = {
-                "success": not (hasattr(result, 'is_error') and result.is_error),
+                "success": not result.get("is_error"),
                 "duration": test_duration,
-                "has_final_brief": hasattr(result, 'final_brief') and result.final_brief is not None,
-                "errors": getattr(result, 'errors', []),
-                "warnings": getattr(result, 'warnings', [])
+                "has_final_brief": result.get("final_brief") is not None,
+                "errors": result.get("errors", []),
+                "warnings": result.get("warnings", [])
             }
             
             logger.info(f"Prueba del workflow completada: {test_result}")
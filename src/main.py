@@ -22,12 +22,13 @@ logger = logging.getLogger(__name__)
 sys.path.append(str(Path(__file__).parent))
 
 from graph.workflow import create_marketing_workflow
-from config.settings import settings
+from config.settings import get_settings
 
 async def main():
     """Función principal del sistema"""
     try:
         logger.info("🚀 Iniciando Sistema Agéntico de Marketing")
+        settings = get_settings()
         logger.info(f"Configuración: LLM Provider = {settings.llm_provider}")
         logger.info(f"Modelo objetivo: {settings.openai_model if settings.llm_provider == 'openai' else settings.anthropic_model}")
         
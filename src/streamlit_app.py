@@ -253,6 +253,7 @@ def generate_brief(prompt: str, llm_provider: str, temperature: float):
             "Finalizing brief..."
         ]
         
+        loop = workflow = None
         try:
             # Ejecutar workflow de forma asíncrona
             loop = asyncio.new_event_loop()
@@ -297,6 +298,9 @@ def generate_brief(prompt: str, llm_provider: str, temperature: float):
             st.error(f"❌ Error generating brief: {str(e)}")
             progress_bar.progress(0)
             status_text.text("❌ Error in process")
+        
+        finally:
+            _close_event_loop(loop, workflow)
 
 def test_system():
     """Test the system with an example prompt"""
@@ -305,6 +309,7 @@ def test_system():
     
     st.info("🧪 Running system test...")
     
+    loop = workflow = None
     try:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
@@ -319,6 +324,19 @@ def test_system():
             
     except Exception as e:
         st.error(f"❌ Test error: {str(e)}")
+    
+    finally:
+        _close_event_loop(loop, workflow)
+
+def _close_event_loop(loop, workflow) -> None:
+    """Cierra las conexiones del workflow ligadas al loop de la petición y el propio loop"""
+    if loop is None:
+        return
+    try:
+        if workflow is not None:
+            loop.run_until_complete(workflow.aclose())
+    finally:
+        loop.close()
 
 def show_metrics():
     """Show system metrics"""
@@ -14,6 +14,15 @@ from src.agents.text_generator import TextGenerator
 from src.agents.caption_creator import CaptionCreator
 from src.agents.visual_concept import VisualConceptAgent
 from src.agents.reasoning_module import ReasoningModuleAgent
+from src.agents.result_optimizer import ResultOptimizer
+from src.agents.fused_content import FusedContentAgent
+from src.agents.video_scripter import VideoScripter
+from src.agents.visual_format_recommender import VisualFormatRecommender
+
+# Importar herramientas LLM
+from src.tools.llm_batcher import LLMBatcher
+from src.tools.batching_proxy import BatchingLLMProxy, close_shared_shelves
+from src.tools.llm_client import _first_json_object
 
 # Importar modelos
 from src.models.content_brief import (
@@ -288,6 +297,418 @@ class TestReasoningModuleAgent:
         assert "VOZ DE MARCA:" in summary
         assert "Objetivo: Ventas" in summary
 
+class TestResultOptimizer:
+    """Tests para el Result Optimizer"""
+    
+    def test_extract_industry_from_prompt(self, mock_llm_client):
+        """Test de detección de industria por palabras clave"""
+        agent = ResultOptimizer(mock_llm_client, enable_rag=False)
+        
+        assert agent._extract_industry_from_prompt("New GYM membership promo") == "fitness"
+        assert agent._extract_industry_from_prompt("Launch of our software app") == "tech"
+        assert agent._extract_industry_from_prompt("Crear un post para una tienda") == "general"
+    
+    def test_extract_industry_from_plural_prompt(self, mock_llm_client):
+        """Test de detección de industria con palabras clave en plural"""
+        agent = ResultOptimizer(mock_llm_client, enable_rag=False)
+        
+        assert agent._extract_industry_from_prompt("Best apps for busy teams") == "tech"
+        assert agent._extract_industry_from_prompt("Promo for local gyms") == "fitness"
+        assert agent._extract_industry_from_prompt("Menú para restaurantes de barrio") == "food"
+        assert agent._extract_industry_from_prompt("Campaña para clínicas dentales") == "fitness"
+        assert agent._extract_industry_from_prompt("Que sea happy y cercano") == "general"
+    
+    @pytest.mark.asyncio
+    async def test_process_success(self, mock_llm_client, sample_analysis):
+        """Test de procesamiento exitoso con datos simulados"""
+        mock_llm_client.generate_structured.return_value = {
+            "content_optimizations": ["Usar un hook más fuerte"],
+            "timing_recommendations": ["Publicar a las 7 PM"],
+            "format_adjustments": [],
+            "engagement_tactics": [],
+            "risk_mitigation": []
+        }
+        agent = ResultOptimizer(mock_llm_client, enable_rag=False)
+        
+        state = {
+            "input_prompt": "Lanzamiento de nuestra nueva app",
+            "prompt_analysis": sample_analysis,
+            "visual_format_recommendation": {"recommended_format": "Video"},
+            "language_config": {"language": "es"},
+            "errors": [],
+            "completed_steps": []
+        }
+        
+        result = await agent.process(state)
+        await agent.aclose()
+        
+        assert result["errors"] == []
+        assert result["result_optimizations"]["optimization_response"]["content_optimizations"]
+        assert "result_optimization" in result["completed_steps"]
+        assert "result_optimizer" in result["agent_timings"]
+    
+    @pytest.mark.asyncio
+    async def test_rag_insights_are_cached(self, mock_llm_client):
+        """Test de caché de insights RAG para el mismo contexto"""
+        agent = ResultOptimizer(mock_llm_client, enable_rag=False)
+        agent.rag_system = Mock()
+        agent.rag_system.generate_enhanced_recommendation.return_value = {
+            "historical_justification": {"source": "Benchmark"},
+            "contextual_justification": {"suggested_hashtags": ["#tech"]},
+            "expected_performance": {"estimated_ctr": 1.8, "estimated_engagement": 4.2, "confidence": "High"}
+        }
+        
+        first = await agent._get_rag_enhanced_insights("tech", "Instagram", "Video", "Launch", "Nuevo producto")
+        second = await agent._get_rag_enhanced_insights("tech", "Instagram", "Video", "Launch", "Nuevo producto")
+        
+        assert first == second
+        assert first is not second
+        
+        # Editar estructuras anidadas de un resultado no altera la caché
+        first["trending_hashtags"].append("#editado")
+        second["projected_metrics"]["expected_ctr"] = 0.0
+        third = await agent._get_rag_enhanced_insights("tech", "Instagram", "Video", "Launch", "Nuevo producto")
+        
+        assert third["trending_hashtags"] == ["#tech"]
+        assert third["projected_metrics"]["expected_ctr"] == pytest.approx(0.018)
+        agent.rag_system.generate_enhanced_recommendation.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_process_error_without_errors_key(self, mock_llm_client, sample_analysis):
+        """Test de registro de errores cuando el estado no trae la lista de errores"""
+        mock_llm_client.generate_structured.side_effect = Exception("API Error")
+        agent = ResultOptimizer(mock_llm_client, enable_rag=False)
+        
+        state = {"input_prompt": "Nuevo producto", "prompt_analysis": sample_analysis}
+        
+        result = await agent.process(state)
+        await agent.aclose()
+        
+        assert len(result["errors"]) == 1
+        assert "API Error" in result["errors"][0]
+
+class TestVisualFormatRecommender:
+    """Tests para el Visual Format Recommender"""
+    
+    @pytest.mark.asyncio
+    async def test_process_updates_dict_state(self, mock_llm_client, sample_analysis):
+        """Test de recomendación escrita en el estado sin reconstruir WorkflowState"""
+        mock_llm_client.stream_structured = AsyncMock(return_value={
+            "recommended_format": "Carousel",
+            "justification": "Muestra varias funcionalidades",
+            "alternative_formats": ["Image"]
+        })
+        state = {
+            "prompt_analysis": sample_analysis,
+            "post_type": PostType.PROMOTIONAL,
+            "brand_voice": {"tone": "Profesional"},
+            "errors": [],
+            "agent_timings": {},
+            "completed_steps": []
+        }
+        
+        agent = VisualFormatRecommender(mock_llm_client)
+        result = await agent.process(state)
+        
+        assert result is state
+        assert result["errors"] == []
+        assert result["visual_format_recommendation"]["recommended_format"] == "Carousel"
+        assert result["prompt_analysis"] is sample_analysis
+        assert "visual_format_recommendation" in result["completed_steps"]
+    
+    @pytest.mark.asyncio
+    async def test_fallback_response_is_not_cached(self, mock_llm_client, sample_analysis):
+        """Test de que una respuesta de respaldo no se sirve después desde caché"""
+        mock_llm_client.stream_structured = AsyncMock(side_effect=[
+            {"error": "Could not parse JSON from local model", "fallback": True},
+            {"recommended_format": "Carousel"}
+        ])
+        agent = VisualFormatRecommender(mock_llm_client)
+        agent.enable_caching = True
+        
+        def new_state():
+            return {
+                "prompt_analysis": sample_analysis,
+                "post_type": PostType.PROMOTIONAL,
+                "brand_voice": {"tone": "Profesional"},
+                "errors": [],
+                "agent_timings": {},
+                "completed_steps": []
+            }
+        
+        first = await agent.process(new_state())
+        second = await agent.process(new_state())
+        
+        assert first["visual_format_recommendation"]["recommended_format"] == "Image"
+        assert second["visual_format_recommendation"]["recommended_format"] == "Carousel"
+        assert mock_llm_client.stream_structured.await_count == 2
+
+class TestVideoScripter:
+    """Tests para el Video Scripter"""
+    
+    @pytest.mark.asyncio
+    async def test_non_video_format_creates_basic_script(self, mock_llm_client, sample_analysis):
+        """Test de script básico sin llamar al LLM cuando el formato no es de video"""
+        state = {
+            "prompt_analysis": sample_analysis,
+            "visual_format_recommendation": {"recommended_format": "Carousel"},
+            "errors": [],
+            "agent_timings": {},
+            "completed_steps": []
+        }
+        
+        agent = VideoScripter(mock_llm_client)
+        result = await agent.process(state)
+        
+        mock_llm_client.generate_structured.assert_not_called()
+        assert result["errors"] == []
+        assert result["video_script"]["script_segments"]
+        assert result["prompt_analysis"] is sample_analysis
+        assert "video_script" in result["completed_steps"]
+        assert "video_scripter" in result["agent_timings"]
+    
+    @pytest.mark.asyncio
+    async def test_platform_from_dict_analysis(self, mock_llm_client, sample_analysis):
+        """Test de plataforma leída de un prompt_analysis ya normalizado a diccionario"""
+        analysis = sample_analysis.model_dump()
+        analysis["platform"] = "TikTok"
+        state = {
+            "prompt_analysis": analysis,
+            "visual_format_recommendation": {"recommended_format": "Carousel"},
+            "errors": [],
+            "agent_timings": {},
+            "completed_steps": []
+        }
+        
+        agent = VideoScripter(mock_llm_client)
+        result = await agent.process(state)
+        
+        assert result["video_script"]["platform_optimized"] == "TikTok"
+    
+    @pytest.mark.asyncio
+    async def test_basic_scripts_do_not_share_segments(self, mock_llm_client, sample_analysis):
+        """Test de que editar un script básico no altera el siguiente"""
+        agent = VideoScripter(mock_llm_client)
+        scripts = []
+        for _ in range(2):
+            state = {
+                "prompt_analysis": sample_analysis,
+                "visual_format_recommendation": {"recommended_format": "Carousel"},
+                "errors": [],
+                "agent_timings": {},
+                "completed_steps": []
+            }
+            result = await agent.process(state)
+            scripts.append(result["video_script"])
+        
+        scripts[0]["script_segments"][0]["narration"] = "Editado"
+        
+        assert scripts[1]["script_segments"][0]["narration"] == "Hook: Attention-grabbing opening"
+
+class TestFusedContentAgent:
+    """Tests para el Fused Content Agent"""
+    
+    @pytest.fixture
+    def content_state(self, sample_analysis):
+        return {
+            "prompt_analysis": sample_analysis,
+            "post_type": PostType.PROMOTIONAL,
+            "brand_voice": BrandVoice(tone="Profesional", personality="Innovador", style="Moderno",
+                                      values=["Innovación"], language_level="Semi-formal"),
+            "factual_grounding": {"key_facts": ["Nuevo producto"]},
+            "visual_format_recommendation": {"recommended_format": "Video"},
+            "language_config": {"language": "es"},
+            "errors": [],
+            "agent_timings": {},
+            "completed_steps": [],
+            "current_step": ""
+        }
+    
+    @pytest.mark.asyncio
+    async def test_process_single_call(self, mock_llm_client, content_state):
+        """Test de generación fusionada con una sola llamada al LLM"""
+        mock_llm_client.generate_structured.return_value = {
+            "core_content": "Descubre nuestro nuevo producto tecnológico pensado para profesionales jóvenes.",
+            "visual_concept": {
+                "mood": "Moderno", "color_palette": ["#000000", "#FFFFFF", "#2E86AB"],
+                "imagery_type": "Producto en uso", "layout_style": "Minimalista",
+                "visual_elements": ["Logo"], "design_notes": "Usar tipografía limpia y mucho espacio"
+            },
+            "video_script": {"script_segments": [], "engagement_elements": [], "hashtags": []}
+        }
+        
+        agent = FusedContentAgent(mock_llm_client)
+        result = await agent.process(content_state)
+        
+        mock_llm_client.generate_structured.assert_called_once()
+        mock_llm_client.generate.assert_not_called()
+        assert result["core_content"].startswith("Descubre")
+        assert result["visual_concept"].mood == "Moderno"
+        assert result["video_script"]["script_segments"]
+        assert {"text_generation", "visual_concept", "video_script"} <= set(result["completed_steps"])
+    
+    @pytest.mark.asyncio
+    async def test_process_falls_back_to_text_generator(self, mock_llm_client, content_state):
+        """Test de fallback al TextGenerator cuando la respuesta fusionada no es válida"""
+        mock_llm_client.generate_structured.return_value = {"core_content": "Demasiado corto"}
+        
+        mock_llm_client.generate.return_value = Mock(
+            content="Contenido principal generado por el TextGenerator como respaldo del agente fusionado."
+        )
+        
+        agent = FusedContentAgent(mock_llm_client)
+        result = await agent.process(content_state)
+        
+        assert "TextGenerator" in result["core_content"]
+        assert "visual_concept" not in result
+        assert "video_script" not in result
+        assert result["completed_steps"] == ["text_generation"]
+
+class TestLLMBatcher:
+    """Tests para el agrupador de llamadas al LLM"""
+    
+    @pytest.mark.asyncio
+    async def test_batch_call_groups_concurrent_calls(self):
+        """Test de agrupación de llamadas concurrentes en un lote"""
+        batch_call = AsyncMock(side_effect=lambda calls: [args[0].upper() for args, _ in calls])
+        batcher = LLMBatcher(AsyncMock(), batch_window_ms=20, batch_call=batch_call)
+        
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+        await batcher.aclose()
+        
+        assert results == ["A", "B"]
+        batch_call.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_aclose_dispatches_pending_calls(self):
+        """Test de que aclose no deja llamadas sin resolver"""
+        batch_call = AsyncMock(side_effect=lambda calls: [args[0] for args, _ in calls])
+        batcher = LLMBatcher(AsyncMock(), batch_window_ms=10_000, batch_call=batch_call)
+        
+        pending = [asyncio.create_task(batcher.submit(prompt)) for prompt in ("a", "b", "c")]
+        await asyncio.sleep(0.01)  # El worker tiene un lote a medio formar
+        await batcher.aclose()
+        
+        results = await asyncio.wait_for(asyncio.gather(*pending), timeout=1)
+        assert results == ["a", "b", "c"]
+    
+    @pytest.mark.asyncio
+    async def test_aclose_before_worker_starts(self):
+        """Test de cierre inmediato tras encolar, antes de que arranque el worker"""
+        call = AsyncMock(return_value="ok")
+        batcher = LLMBatcher(call, batch_window_ms=10_000)
+        
+        task = asyncio.create_task(batcher.submit("a"))
+        await asyncio.sleep(0)  # La llamada está en la cola pero el worker no ha corrido
+        await batcher.aclose()
+        
+        assert await asyncio.wait_for(task, timeout=1) == "ok"
+
+class TestBatchingLLMProxy:
+    """Tests para la caché de respuestas del proxy LLM"""
+    
+    @pytest.mark.asyncio
+    async def test_repeated_prompt_served_from_cache_as_copy(self, mock_llm_client):
+        """Test de respuesta cacheada devuelta como copia independiente"""
+        mock_llm_client.generate_structured.return_value = {"hashtags": ["#uno"]}
+        proxy = BatchingLLMProxy(mock_llm_client)
+        
+        first = await proxy.generate_structured("prompt", "JSON")
+        first["hashtags"].append("#modificado")
+        second = await proxy.generate_structured("prompt", "JSON")
+        
+        assert second == {"hashtags": ["#uno"]}
+        assert mock_llm_client.generate_structured.await_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_lru_evicts_oldest_entry(self, mock_llm_client):
+        """Test de expulsión de la entrada más antigua al llenarse la caché"""
+        mock_llm_client.generate_structured.return_value = {"ok": True}
+        proxy = BatchingLLMProxy(mock_llm_client, cache_max_entries=1)
+        
+        for prompt in ("a", "b", "a"):
+            await proxy.generate_structured(prompt, "JSON")
+        
+        assert mock_llm_client.generate_structured.await_count == 3
+    
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_regenerated(self, mock_llm_client):
+        """Test de expiración de las respuestas cacheadas"""
+        mock_llm_client.generate_structured.return_value = {"ok": True}
+        proxy = BatchingLLMProxy(mock_llm_client, cache_ttl_seconds=0.01)
+        
+        await proxy.generate_structured("prompt", "JSON")
+        await asyncio.sleep(0.02)
+        await proxy.generate_structured("prompt", "JSON")
+        
+        assert mock_llm_client.generate_structured.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_fallback_response_is_not_cached(self, mock_llm_client):
+        """Test de que las respuestas de respaldo no se cachean"""
+        mock_llm_client.generate_structured.return_value = {"error": "sin JSON", "fallback": True}
+        proxy = BatchingLLMProxy(mock_llm_client)
+        
+        await proxy.generate_structured("prompt", "JSON")
+        await proxy.generate_structured("prompt", "JSON")
+        
+        assert mock_llm_client.generate_structured.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_disk_cache_survives_restart(self, mock_llm_client, tmp_path):
+        """Test de respuesta recuperada de la caché en disco por otro proxy"""
+        cache_path = str(tmp_path / "llm_cache")
+        mock_llm_client.generate_structured.return_value = {"ok": True}
+        await BatchingLLMProxy(mock_llm_client, cache_path=cache_path).generate_structured("prompt", "JSON")
+        close_shared_shelves()
+        
+        other_client = Mock()
+        other_client.generate_structured = AsyncMock()
+        try:
+            result = await BatchingLLMProxy(other_client, cache_path=cache_path).generate_structured("prompt", "JSON")
+        finally:
+            close_shared_shelves()
+        
+        assert result == {"ok": True}
+        other_client.generate_structured.assert_not_awaited()
+
+class TestFirstJsonObject:
+    """Tests para la lectura del primer objeto JSON de un stream"""
+    
+    @staticmethod
+    async def _stream(chunks, consumed):
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+    
+    @pytest.mark.asyncio
+    async def test_braces_and_escapes_inside_strings(self):
+        """Test de llaves y comillas escapadas dentro de cadenas"""
+        consumed = []
+        chunks = ['Texto previo {"a": "x}\\"{", ', '"b": {"c": 1}}', ' resto']
+        
+        result = await _first_json_object(self._stream(chunks, consumed))
+        
+        assert result == {"a": 'x}"{', "b": {"c": 1}}
+    
+    @pytest.mark.asyncio
+    async def test_stops_reading_when_object_closes(self):
+        """Test de que no se consume el stream tras cerrarse el objeto"""
+        consumed = []
+        chunks = ['{"a": 1}', ' no debe leerse']
+        
+        result = await _first_json_object(self._stream(chunks, consumed))
+        
+        assert result == {"a": 1}
+        assert consumed == ['{"a": 1}']
+    
+    @pytest.mark.asyncio
+    async def test_incomplete_object_returns_none(self):
+        """Test de stream sin objeto completo"""
+        result = await _first_json_object(self._stream(['{"a": ', '1'], []))
+        
+        assert result is None
+
 # Tests de integración
 class TestAgentIntegration:
     """Tests de integración entre agentes"""
@@ -0,0 +1,256 @@
+"""
+Proxy de cliente LLM que agrupa llamadas concurrentes de varios agentes
+"""
+import atexit
+import copy
+import hashlib
+import logging
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.tools.llm_batcher import BatchCall, LLMBatcher
+from src.tools.llm_client import LOCAL_FALLBACK_CONTENT, LLMClient, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+# Cachés en disco abiertas en el proceso: una por fichero, compartida por todos los proxies
+# (Streamlit crea un workflow por petición) y protegida por un cerrojo
+_shelves: Dict[str, shelve.Shelf] = {}
+_shelves_lock = threading.Lock()
+
+
+def _shared_shelf(path: str, ttl_seconds: float) -> shelve.Shelf:
+    """Abre la caché en disco una sola vez por proceso, descartando las entradas expiradas"""
+    with _shelves_lock:
+        shelf = _shelves.get(path)
+        if shelf is None:
+            shelf = shelve.open(path)
+            now = time.time()
+            expired = [key for key in shelf if now - shelf[key][0] > ttl_seconds]
+            for key in expired:
+                del shelf[key]
+            if expired:
+                logger.debug("Eliminadas %d respuestas expiradas de la caché en disco", len(expired))
+            _shelves[path] = shelf
+        return shelf
+
+
+@atexit.register
+def close_shared_shelves() -> None:
+    """Cierra las cachés en disco del proceso (se llama también al salir)"""
+    with _shelves_lock:
+        for shelf in _shelves.values():
+            shelf.close()
+        _shelves.clear()
+
+
+class BatchingLLMProxy:
+    """
+    Expone la misma interfaz `generate` / `generate_structured` que el cliente LLM,
+    pero encola las peticiones y las despacha por lotes con `LLMBatcher`.
+
+    Los agentes lo reciben en lugar del cliente sin cambiar su código. Si el
+    proveedor ofrece un endpoint multi-prompt, se puede pasar como
+    `batch_generate` / `batch_generate_structured` para enviar cada lote en una
+    sola petición. Sin endpoint batch las llamadas van directas al cliente: esperar
+    la ventana del lote solo añadiría latencia sin compartir ninguna petición.
+
+    Las respuestas se cachean por coincidencia exacta del prompt y sus
+    parámetros (LRU con expiración), de modo que un brief repetido no vuelve a
+    llamar al LLM. Las respuestas de respaldo de un proveedor caído no se
+    cachean. `cache_max_entries=0` desactiva la caché. Con `cache_path` las
+    respuestas también se guardan en disco (`shelve`) y sobreviven a un
+    reinicio del proceso, con la misma expiración. El fichero se abre una sola
+    vez por proceso y lo comparten todos los proxies con la misma ruta.
+    """
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        max_wait_ms: float = 10.0,
+        max_batch: int = 8,
+        batch_generate: Optional[Callable[[List[BatchCall]], Awaitable[List[Any]]]] = None,
+        batch_generate_structured: Optional[Callable[[List[BatchCall]], Awaitable[List[Any]]]] = None,
+        cache_max_entries: int = 128,
+        cache_ttl_seconds: float = 600.0,
+        cache_path: Optional[str] = None,
+    ):
+        self.llm = llm_client
+        self.cache_max_entries = cache_max_entries
+        self.cache_ttl = cache_ttl_seconds
+        self.cache_path = cache_path
+        self._cache: "OrderedDict[bytes, Tuple[float, Any]]" = OrderedDict()
+        self._shelf: Optional[shelve.Shelf] = None
+        self._generate = self._batcher(llm_client.generate, batch_generate, max_wait_ms, max_batch)
+        self._generate_structured = self._batcher(
+            llm_client.generate_structured, batch_generate_structured, max_wait_ms, max_batch
+        )
+
+    @staticmethod
+    def _batcher(call: Callable[..., Awaitable[Any]],
+                 batch_call: Optional[Callable[[List[BatchCall]], Awaitable[List[Any]]]],
+                 max_wait_ms: float, max_batch: int) -> Optional[LLMBatcher]:
+        """Agrupador para `call` solo si hay un endpoint batch al que enviar los lotes"""
+        if batch_call is None:
+            return None
+        return LLMBatcher(call, batch_window_ms=max_wait_ms, max_batch=max_batch, batch_call=batch_call)
+
+    async def generate(self, prompt: str, **kwargs) -> LLMResponse:
+        """Genera texto pasando por la caché y, si hay endpoint batch, por el lote actual"""
+        key = self._cache_key("generate", prompt, kwargs)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        if self._generate is not None:
+            response = await self._generate.submit(prompt, **kwargs)
+        else:
+            response = await self.llm.generate(prompt, **kwargs)
+        self._store(key, response)
+        return response
+
+    async def generate_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
+        """Genera una respuesta estructurada pasando por la caché y, si hay endpoint batch, por el lote actual"""
+        key = self._cache_key("generate_structured", prompt, kwargs, expected_format)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        if self._generate_structured is not None:
+            response = await self._generate_structured.submit(prompt, expected_format, **kwargs)
+        else:
+            response = await self.llm.generate_structured(prompt, expected_format, **kwargs)
+        self._store(key, response)
+        return response
+
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Genera texto por fragmentos. El streaming no pasa por el lote (cada
+        petición es una conexión abierta), pero sí por la caché
+        """
+        key = self._cache_key("generate_stream", prompt, kwargs)
+        cached = self._get_cached(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.llm.generate_stream(prompt, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, "".join(chunks))
+
+    @staticmethod
+    def _cache_key(method: str, prompt: str, kwargs: Dict[str, Any], expected_format: str = "") -> bytes:
+        """Clave compacta para el prompt completo y sus parámetros"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (method, expected_format, repr(sorted(kwargs.items())), prompt):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.digest()
+
+    def _get_cached(self, key: bytes) -> Any:
+        """Devuelve una copia de la respuesta cacheada si no ha expirado"""
+        entry = self._cache.get(key)
+        if entry is None:
+            entry = self._get_persisted(key)
+            if entry is None:
+                return None
+
+        stored_at, response = entry
+        if time.monotonic() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            self._delete_persisted(key)
+            return None
+
+        self._cache.move_to_end(key)
+        logger.debug("Respuesta LLM servida desde caché")
+        # Los agentes modifican las respuestas (listas de hashtags, colores...), así que se copian
+        return copy.deepcopy(response)
+
+    @staticmethod
+    def _is_cacheable(response: Any) -> bool:
+        """Las respuestas de respaldo o con error de un proveedor caído no se cachean"""
+        if isinstance(response, LLMResponse):
+            return not (response.metadata.get("fallback") or response.provider.endswith("_fallback"))
+        if isinstance(response, dict):
+            return "fallback" not in response and "error" not in response
+        if isinstance(response, str):
+            return not response.startswith(LOCAL_FALLBACK_CONTENT)
+        return True
+
+    def _store(self, key: bytes, response: Any) -> None:
+        """Guarda una copia de la respuesta en la caché LRU"""
+        if self.cache_max_entries <= 0 or not self._is_cacheable(response):
+            return
+        self._cache[key] = (time.monotonic(), copy.deepcopy(response))
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+        shelf = self._open_shelf()
+        if shelf is not None:
+            try:
+                with _shelves_lock:
+                    shelf[key.hex()] = (time.time(), response)
+            except Exception as e:
+                logger.warning("No se pudo guardar la respuesta en la caché en disco: %s", e)
+
+    def _open_shelf(self) -> Optional[shelve.Shelf]:
+        """Caché en disco compartida del proceso, abierta la primera vez que se necesita"""
+        if self._shelf is None and self.cache_path and self.cache_max_entries > 0:
+            try:
+                self._shelf = _shared_shelf(self.cache_path, self.cache_ttl)
+            except Exception as e:
+                logger.warning("Caché en disco no disponible (%s), solo se usa memoria", e)
+                self.cache_path = None
+        return self._shelf
+
+    def _delete_persisted(self, key: bytes) -> None:
+        """Elimina una respuesta expirada de la caché en disco"""
+        shelf = self._open_shelf()
+        if shelf is None:
+            return
+        try:
+            with _shelves_lock:
+                del shelf[key.hex()]
+        except KeyError:
+            pass
+        except Exception as e:
+            logger.warning("No se pudo eliminar la respuesta de la caché en disco: %s", e)
+
+    def _get_persisted(self, key: bytes) -> Optional[Tuple[float, Any]]:
+        """Recupera una respuesta de la caché en disco y la sube a memoria"""
+        shelf = self._open_shelf()
+        if shelf is None:
+            return None
+        try:
+            with _shelves_lock:
+                stored_at, response = shelf[key.hex()]
+        except KeyError:
+            return None
+        except Exception as e:
+            logger.warning("Entrada ilegible en la caché en disco: %s", e)
+            return None
+
+        # Convertir la marca de tiempo de reloj a monotónica conservando la antigüedad
+        entry = (time.monotonic() - (time.time() - stored_at), response)
+        self._cache[key] = entry
+        if len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def aclose(self) -> None:
+        """Detiene los agrupadores y espera los lotes en curso"""
+        for batcher in (self._generate, self._generate_structured):
+            if batcher is not None:
+                await batcher.aclose()
+        # La caché en disco es del proceso: la cierra `close_shared_shelves` al salir
+        self._shelf = None
+
+    def __getattr__(self, name: str) -> Any:
+        # El resto de atributos (clients, get_client, ...) se delegan al cliente real
+        return getattr(self.llm, name)
@@ -0,0 +1,130 @@
+"""
+Agrupador de llamadas concurrentes al LLM
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Una llamada pendiente: (args, kwargs)
+BatchCall = Tuple[Tuple[Any, ...], Dict[str, Any]]
+
+
+class LLMBatcher:
+    """
+    Agrupa las llamadas concurrentes que llegan dentro de una ventana de tiempo
+    y las despacha como un único lote.
+
+    Si se proporciona `batch_call`, el lote completo se envía en una sola
+    petición (proveedores con endpoint batch). Si no, las llamadas del lote se
+    lanzan en paralelo con `asyncio.gather` usando `call`.
+    """
+
+    def __init__(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        batch_window_ms: float = 25.0,
+        max_batch: int = 8,
+        batch_call: Optional[Callable[[List[BatchCall]], Awaitable[List[Any]]]] = None,
+    ):
+        self._call = call
+        self._batch_call = batch_call
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, *args, **kwargs) -> Any:
+        """Encola una llamada y espera su resultado"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(((args, kwargs), future))
+        return await future
+
+    def _ensure_worker(self) -> None:
+        """Arranca la tarea de fondo en el event loop actual si no está activa"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        """Recoge lotes de la cola hasta llenar `max_batch` o agotar la ventana"""
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = self._loop.time() + self.batch_window
+
+                while len(batch) < self.max_batch:
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                self._start_dispatch(batch)
+                batch = []
+        except asyncio.CancelledError:
+            # Al cerrar, despachar el lote a medio formar para no dejar futures sin resolver
+            self._start_dispatch(batch)
+            raise
+
+    def _start_dispatch(self, batch: List[Tuple[BatchCall, asyncio.Future]]) -> None:
+        """Lanza el despacho de un lote junto con lo que quede en la cola"""
+        while self._queue is not None and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if not batch:
+            return
+        task = self._loop.create_task(self._dispatch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[BatchCall, asyncio.Future]]) -> None:
+        """Ejecuta un lote y reparte los resultados entre los futures"""
+        calls = [call for call, _ in batch]
+        logger.debug(f"Despachando lote de {len(calls)} llamadas al LLM")
+
+        try:
+            if self._batch_call is not None:
+                results = await self._batch_call(calls)
+                if len(results) != len(calls):
+                    raise ValueError(f"El lote devolvió {len(results)} resultados para {len(calls)} llamadas")
+            else:
+                results = await asyncio.gather(
+                    *(self._call(*args, **kwargs) for args, kwargs in calls),
+                    return_exceptions=True
+                )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def aclose(self) -> None:
+        """
+        Detiene la tarea de fondo y espera los lotes en curso. Las llamadas aún
+        en cola se despachan antes de cerrar para que ningún `submit` quede esperando
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            # Si la tarea se canceló antes de arrancar, la cola sigue intacta
+            self._start_dispatch([])
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -5,14 +5,20 @@ import asyncio
 import json
 import logging
 import time
-from typing import Dict, Any, Optional, Union
+import weakref
+from typing import AsyncIterator, Dict, Any, Optional, Union
 from abc import ABC, abstractmethod
 
 import httpx
 from pydantic import BaseModel
 
+from src.config.settings import get_hot_settings
+
 logger = logging.getLogger(__name__)
 
+# Texto de respaldo de Ollama cuando el modelo local no está disponible
+LOCAL_FALLBACK_CONTENT = "[LOCAL MODEL UNAVAILABLE] Simulated response for development"
+
 class LLMResponse(BaseModel):
     """Respuesta estándar del LLM"""
     content: str
@@ -22,6 +28,68 @@ class LLMResponse(BaseModel):
     processing_time: float
     metadata: Dict[str, Any] = {}
 
+# Conexiones HTTP reutilizadas entre llamadas y agentes (un cliente por event loop)
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido del event loop actual, con keep-alive y pool de conexiones"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=get_hot_settings().timeout_seconds, limits=_HTTP_LIMITS)
+        _http_clients[loop] = client
+    return client
+
+async def aclose_http_client() -> None:
+    """Cierra el cliente HTTP compartido del event loop actual"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def _first_json_object(chunks: AsyncIterator[str]) -> Optional[Dict[str, Any]]:
+    """
+    Lee fragmentos de texto hasta que se cierra el primer objeto JSON de nivel
+    superior y lo devuelve sin esperar al resto del stream. Devuelve None si el
+    stream termina sin un objeto completo y válido.
+    """
+    buffer = []
+    depth = 0
+    in_string = False
+    escaped = False
+    
+    try:
+        async for chunk in chunks:
+            for char in chunk:
+                if depth == 0 and char != "{":
+                    continue
+                buffer.append(char)
+                
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif char == "\\":
+                        escaped = True
+                    elif char == '"':
+                        in_string = False
+                elif char == '"':
+                    in_string = True
+                elif char == "{":
+                    depth += 1
+                elif char == "}":
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            parsed = json.loads("".join(buffer))
+                        except json.JSONDecodeError:
+                            return None
+                        return parsed if isinstance(parsed, dict) else None
+    finally:
+        # Cerrar la conexión en cuanto se tiene el objeto
+        await chunks.aclose()
+    
+    return None
+
 class LLMClient(ABC):
     """Cliente base abstracto para LLMs"""
     
@@ -34,6 +102,37 @@ class LLMClient(ABC):
     async def generate_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
         """Genera respuesta estructurada (JSON)"""
         pass
+    
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Genera texto por fragmentos; por defecto entrega la respuesta completa de una vez"""
+        response = await self.generate(prompt, **kwargs)
+        yield response.content
+    
+    async def stream_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
+        """
+        Genera respuesta estructurada (JSON) por streaming y la devuelve en cuanto
+        se cierra el objeto raíz. Si el stream no produce un objeto válido, recurre
+        a `generate_structured`
+        """
+        # Con json_mode cada generate_stream activa el modo JSON nativo del proveedor,
+        # así que no hacen falta instrucciones de formato
+        if kwargs.get("json_mode"):
+            structured_prompt = prompt
+        else:
+            structured_prompt = f"""{prompt}
+
+IMPORTANT: Respond with valid JSON only. No additional text.
+Expected format: {expected_format}
+"""
+        parsed = await _first_json_object(self.generate_stream(structured_prompt, **kwargs))
+        if parsed is None:
+            logger.warning("Stream sin JSON completo, usando generate_structured")
+            return await self.generate_structured(prompt, expected_format, **kwargs)
+        return self._normalize_json_fields(parsed)
+    
+    def _normalize_json_fields(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Normaliza los campos del JSON recibido; por defecto no los modifica"""
+        return data
 
 class GoogleAIClient(LLMClient):
     """Cliente para Google AI (Gemini)"""
@@ -45,7 +144,8 @@ class GoogleAIClient(LLMClient):
         
     async def generate(self, prompt: str, **kwargs) -> LLMResponse:
         start_time = time.time()
-        max_retries = 3
+        # Al menos un intento aunque la configuración recargada indique 0 reintentos
+        max_retries = max(1, get_hot_settings().max_retries)
         base_delay = 1.0
         
         for attempt in range(max_retries):
@@ -68,15 +168,23 @@ class GoogleAIClient(LLMClient):
                     }
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        url,
-                        headers=headers,
-                        json=data,
-                        params={"key": self.api_key}
-                    )
-                    response.raise_for_status()
-                    
+                # Instrucciones estáticas como prefijo estable (cacheable por el proveedor)
+                if kwargs.get("system_prompt"):
+                    data["systemInstruction"] = {"parts": [{"text": kwargs["system_prompt"]}]}
+                if kwargs.get("service_tier"):
+                    data["serviceTier"] = kwargs["service_tier"]
+                if kwargs.get("json_mode"):
+                    data["generationConfig"]["responseMimeType"] = "application/json"
+                
+                response = await _http_client().post(
+                    url,
+                    headers=headers,
+                    json=data,
+                    params={"key": self.api_key},
+                    timeout=30.0
+                )
+                response.raise_for_status()
+                
                 result = response.json()
                 content = result["candidates"][0]["content"]["parts"][0]["text"]
                 
@@ -100,6 +208,45 @@ class GoogleAIClient(LLMClient):
                 logger.error(f"Error en Google AI: {e}")
                 raise
     
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Genera texto por fragmentos usando el endpoint SSE de Gemini"""
+        url = f"{self.base_url}/{self.model}:streamGenerateContent"
+        data = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": kwargs.get("temperature", 0.7),
+                "maxOutputTokens": kwargs.get("max_tokens", 2000)
+            }
+        }
+        if kwargs.get("system_prompt"):
+            data["systemInstruction"] = {"parts": [{"text": kwargs["system_prompt"]}]}
+        if kwargs.get("service_tier"):
+            data["serviceTier"] = kwargs["service_tier"]
+        if kwargs.get("json_mode"):
+            data["generationConfig"]["responseMimeType"] = "application/json"
+        
+        try:
+            async with _http_client().stream(
+                "POST",
+                url,
+                headers={"Content-Type": "application/json"},
+                json=data,
+                params={"key": self.api_key, "alt": "sse"},
+                timeout=30.0
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[5:])
+                    for candidate in chunk.get("candidates", []):
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+        except Exception as e:
+            logger.error(f"Error en streaming de Google AI: {e}")
+            raise
+    
     async def generate_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
         """Genera respuesta estructurada con manejo de errores JSON"""
         try:
@@ -179,21 +326,28 @@ class GroqClient(LLMClient):
                 "Content-Type": "application/json"
             }
             
+            messages = [{"role": "user", "content": prompt}]
+            if kwargs.get("system_prompt"):
+                messages.insert(0, {"role": "system", "content": kwargs["system_prompt"]})
+            
+            # `groq_model` permite a un agente usar otro modelo de Groq sin afectar al resto
+            model = kwargs.get("groq_model") or self.model
             data = {
-                "model": self.model,
-                "messages": [{"role": "user", "content": prompt}],
+                "model": model,
+                "messages": messages,
                 "temperature": kwargs.get("temperature", 0.7),
                 "max_tokens": kwargs.get("max_tokens", 2000)
             }
+            if kwargs.get("json_mode"):
+                data["response_format"] = {"type": "json_object"}
+            
+            response = await _http_client().post(
+                self.base_url,
+                headers=headers,
+                json=data
+            )
+            response.raise_for_status()
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.base_url,
-                    headers=headers,
-                    json=data
-                )
-                response.raise_for_status()
-                
             result = response.json()
             content = result["choices"][0]["message"]["content"]
             
@@ -201,7 +355,7 @@ class GroqClient(LLMClient):
             
             return LLMResponse(
                 content=content,
-                model=self.model,
+                model=model,
                 provider="groq",
                 tokens_used=result.get("usage", {}).get("total_tokens"),
                 processing_time=processing_time
@@ -211,6 +365,44 @@ class GroqClient(LLMClient):
             logger.error(f"Error en Groq: {e}")
             raise
     
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Genera texto por fragmentos usando el streaming SSE compatible con OpenAI"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        messages = [{"role": "user", "content": prompt}]
+        if kwargs.get("system_prompt"):
+            messages.insert(0, {"role": "system", "content": kwargs["system_prompt"]})
+        
+        data = {
+            "model": kwargs.get("groq_model") or self.model,
+            "messages": messages,
+            "temperature": kwargs.get("temperature", 0.7),
+            "max_tokens": kwargs.get("max_tokens", 2000),
+            "stream": True
+        }
+        # Sin response_format, stream_structured dejaría el modo JSON sin instrucciones
+        if kwargs.get("json_mode"):
+            data["response_format"] = {"type": "json_object"}
+        
+        try:
+            async with _http_client().stream("POST", self.base_url, headers=headers, json=data) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    delta = json.loads(payload)["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+        except Exception as e:
+            logger.error(f"Error en streaming de Groq: {e}")
+            raise
+    
     async def generate_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
         # Mejorar prompt para modelos locales con instrucciones más específicas
         structured_prompt = f"""
@@ -317,60 +509,117 @@ Ensure all strings are properly quoted and the JSON is valid.
         return normalize_recursive(data)
 
 class OllamaClient(LLMClient):
-    """Cliente para modelos locales usando Ollama"""
+    """
+    Cliente para modelos locales usando Ollama.
+    
+    `structured_model` permite servir las respuestas JSON (cortas y guiadas por
+    esquema) con una variante cuantizada del modelo, p. ej. "llama3.1:8b-instruct-q8_0",
+    manteniendo `model` para la prosa. Si no se indica, se usa `model` para todo.
+    """
     
-    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434"):
+    def __init__(self, model: str = "llama3.1", base_url: str = "http://localhost:11434",
+                 structured_model: Optional[str] = None):
         self.model = model
         self.base_url = base_url
+        self.structured_model = structured_model or model
         
     async def generate(self, prompt: str, **kwargs) -> LLMResponse:
         start_time = time.time()
+        model = kwargs.get("model") or self.model
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                payload = {
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": kwargs.get("temperature", 0.7),
-                        "top_p": kwargs.get("top_p", 0.9),
-                        "max_tokens": kwargs.get("max_tokens", 2048)
-                    }
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {
+                    "temperature": kwargs.get("temperature", 0.7),
+                    "top_p": kwargs.get("top_p", 0.9),
+                    "max_tokens": kwargs.get("max_tokens", 2048)
                 }
+            }
+            if kwargs.get("system_prompt"):
+                payload["system"] = kwargs["system_prompt"]
+            if kwargs.get("json_mode"):
+                payload["format"] = "json"
+            
+            response = await _http_client().post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=60.0
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                processing_time = time.time() - start_time
                 
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
+                return LLMResponse(
+                    content=data.get("response", ""),
+                    model=model,
+                    provider="ollama",
+                    processing_time=processing_time,
+                    metadata={"local": True, "base_url": self.base_url}
                 )
+            else:
+                raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    processing_time = time.time() - start_time
-                    
-                    return LLMResponse(
-                        content=data.get("response", ""),
-                        model=self.model,
-                        provider="ollama",
-                        processing_time=processing_time,
-                        metadata={"local": True, "base_url": self.base_url}
-                    )
-                else:
-                    raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
-                    
         except Exception as e:
             logger.error(f"Error en Ollama: {e}")
             # Fallback a respuesta simulada para desarrollo
             processing_time = time.time() - start_time
             return LLMResponse(
-                content="[LOCAL MODEL UNAVAILABLE] Simulated response for development",
-                model=self.model,
+                content=LOCAL_FALLBACK_CONTENT,
+                model=model,
                 provider="ollama_fallback",
                 processing_time=processing_time,
                 metadata={"local": True, "fallback": True, "error": str(e)}
             )
     
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Genera texto por fragmentos leyendo el NDJSON de Ollama"""
+        payload = {
+            "model": kwargs.get("model") or self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": kwargs.get("temperature", 0.7),
+                "top_p": kwargs.get("top_p", 0.9),
+                "max_tokens": kwargs.get("max_tokens", 2048)
+            }
+        }
+        if kwargs.get("system_prompt"):
+            payload["system"] = kwargs["system_prompt"]
+        if kwargs.get("json_mode"):
+            payload["format"] = "json"
+        
+        started = False
+        try:
+            async with _http_client().stream(
+                "POST", f"{self.base_url}/api/generate", json=payload, timeout=60.0
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        started = True
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        except Exception as e:
+            if started:
+                logger.error(f"Error en streaming de Ollama: {e}")
+                raise
+            # Sin fragmentos emitidos: usar la misma respuesta de respaldo que generate()
+            response = await self.generate(prompt, **kwargs)
+            yield response.content
+    
+    async def stream_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
+        """Genera respuesta estructurada por streaming con el modelo para JSON"""
+        return await super().stream_structured(prompt, expected_format, **{"model": self.structured_model, **kwargs})
+    
     async def generate_structured(self, prompt: str, expected_format: str, **kwargs) -> Dict[str, Any]:
         """Genera respuesta estructurada usando Ollama"""
         structured_prompt = f"""{prompt}
@@ -379,7 +628,7 @@ IMPORTANT: Respond with valid JSON only. No additional text.
 Expected format: {expected_format}
 """
         
-        response = await self.generate(structured_prompt, **kwargs)
+        response = await self.generate(structured_prompt, **{"model": self.structured_model, **kwargs})
         
         try:
             # Intentar parsear como JSON
@@ -414,8 +663,26 @@ class UnifiedLLMClient:
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.clients = {}
+        # Límite de llamadas simultáneas por proveedor (según sus límites RPM/TPM)
+        self.max_concurrency = {
+            "google": int(config.get("GOOGLE_MAX_CONCURRENCY", 8)),
+            "groq": int(config.get("GROQ_MAX_CONCURRENCY", 6)),
+            "ollama": int(config.get("OLLAMA_MAX_CONCURRENCY", 2)),
+        }
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
         self._setup_clients()
     
+    def _provider_slot(self, provider: str) -> asyncio.Semaphore:
+        """Semáforo del proveedor; se recrean si cambia el event loop (p. ej. varios asyncio.run)"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore_loop = loop
+            self._semaphores = {
+                name: asyncio.Semaphore(limit) for name, limit in self.max_concurrency.items()
+            }
+        return self._semaphores[provider]
+    
     def _setup_clients(self):
         """Configura los clientes disponibles"""
         # Google AI
@@ -446,7 +713,8 @@ class UnifiedLLMClient:
             ollama_url = self.config.get("OLLAMA_URL", "http://localhost:11434")
             self.clients["ollama"] = OllamaClient(
                 model=ollama_model,
-                base_url=ollama_url
+                base_url=ollama_url,
+                structured_model=self.config.get("OLLAMA_STRUCTURED_MODEL")
             )
             logger.info(f"Ollama client configurado: {ollama_model}")
         except Exception as e:
@@ -455,6 +723,10 @@ class UnifiedLLMClient:
         if not self.clients:
             logger.warning("No se configuraron clientes LLM")
     
+    async def aclose(self) -> None:
+        """Cierra las conexiones HTTP compartidas del event loop actual"""
+        await aclose_http_client()
+    
     def get_client(self, provider: str = None) -> LLMClient:
         """Obtiene el cliente para el proveedor especificado con fallback inteligente"""
         if provider and provider in self.clients:
@@ -492,7 +764,8 @@ class UnifiedLLMClient:
             try:
                 client = self.clients[provider_name]
                 logger.info(f"Intentando generar con {provider_name}")
-                response = await client.generate(prompt, **kwargs)
+                async with self._provider_slot(provider_name):
+                    response = await client.generate(prompt, **kwargs)
                 logger.info(f"Generación exitosa con {provider_name}")
                 return response
             except Exception as e:
@@ -514,6 +787,69 @@ class UnifiedLLMClient:
         else:
             raise RuntimeError("No hay proveedores disponibles")
     
+    async def generate_stream(self, prompt: str, provider: str = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Genera texto por fragmentos con fallback automático.
+        Solo se cambia de proveedor si el fallo ocurre antes del primer fragmento
+        """
+        providers_to_try = []
+        
+        if provider and provider in self.clients:
+            providers_to_try.append(provider)
+        
+        for name in ("google", "groq", "ollama"):
+            if name in self.clients and name not in providers_to_try:
+                providers_to_try.append(name)
+        
+        last_error = None
+        
+        for provider_name in providers_to_try:
+            started = False
+            try:
+                logger.info(f"Intentando generar (streaming) con {provider_name}")
+                async with self._provider_slot(provider_name):
+                    async for chunk in self.clients[provider_name].generate_stream(prompt, **kwargs):
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                logger.warning(f"Error con {provider_name}: {e}")
+                last_error = e
+        
+        if last_error:
+            logger.error(f"Todos los proveedores fallaron. Último error: {last_error}")
+            raise last_error
+        raise RuntimeError("No hay proveedores disponibles")
+    
+    async def stream_structured(self, prompt: str, expected_format: str, provider: str = None, **kwargs) -> Dict[str, Any]:
+        """Genera respuesta estructurada por streaming con fallback automático entre proveedores"""
+        providers_to_try = []
+        
+        if provider and provider in self.clients:
+            providers_to_try.append(provider)
+        
+        for name in ("google", "groq", "ollama"):
+            if name in self.clients and name not in providers_to_try:
+                providers_to_try.append(name)
+        
+        last_error = None
+        
+        for provider_name in providers_to_try:
+            try:
+                logger.info(f"Intentando generar estructura (streaming) con {provider_name}")
+                async with self._provider_slot(provider_name):
+                    return await self.clients[provider_name].stream_structured(prompt, expected_format, **kwargs)
+            except Exception as e:
+                logger.warning(f"Error con {provider_name}: {e}")
+                last_error = e
+        
+        if last_error:
+            logger.error(f"Todos los proveedores fallaron. Último error: {last_error}")
+            raise last_error
+        raise RuntimeError("No hay proveedores disponibles")
+    
     async def generate_structured(self, prompt: str, expected_format: str, provider: str = None, **kwargs) -> Dict[str, Any]:
         """Genera respuesta estructurada usando el proveedor especificado con fallback automático"""
         # Lista de proveedores en orden de preferencia
@@ -536,7 +872,8 @@ class UnifiedLLMClient:
             try:
                 client = self.clients[provider_name]
                 logger.info(f"Intentando generar estructura con {provider_name}")
-                response = await client.generate_structured(prompt, expected_format, **kwargs)
+                async with self._provider_slot(provider_name):
+                    response = await client.generate_structured(prompt, expected_format, **kwargs)
                 logger.info(f"Generación estructurada exitosa con {provider_name}")
                 return response
             except Exception as e:
@@ -580,6 +917,11 @@ def create_llm_client() -> UnifiedLLMClient:
         "GROQ_MODEL": os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile"),
         "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "llama3.1:8b"),
         "OLLAMA_URL": os.getenv("OLLAMA_URL", "http://localhost:11434"),
+        "GOOGLE_MAX_CONCURRENCY": os.getenv("GOOGLE_MAX_CONCURRENCY", "8"),
+        "GROQ_MAX_CONCURRENCY": os.getenv("GROQ_MAX_CONCURRENCY", "6"),
+        "OLLAMA_MAX_CONCURRENCY": os.getenv("OLLAMA_MAX_CONCURRENCY", "2"),
+        # Variante cuantizada (int8/fp8) opcional para las respuestas JSON
+        "OLLAMA_STRUCTURED_MODEL": os.getenv("OLLAMA_STRUCTURED_MODEL"),
     }
     
     return UnifiedLLMClient(config)
@@ -37,6 +37,7 @@ class RealTimeDataClient:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
+            self.session = None
     
     async def get_real_time_marketing_data(self, 
                                          industry: str = "general",
@@ -21,7 +21,7 @@ async def test_google_ai():
         return False
     
     try:
-        client = GoogleAIClient(settings.google_api_key, settings.google_model)
+        client = GoogleAIClient(settings.google_api_key.get_secret_value(), settings.google_model)
         response = await client.generate("Test prompt: Say 'Hello from Gemini'")
         print(f"OK Google AI ({settings.google_model}): {response.content[:50]}...")
         return True
@@ -38,7 +38,7 @@ async def test_groq():
         return False
     
     try:
-        client = GroqClient(settings.groq_api_key, settings.groq_model)
+        client = GroqClient(settings.groq_api_key.get_secret_value(), settings.groq_model)
         response = await client.generate("Test prompt: Say 'Hello from Groq'")
         print(f"OK Groq ({settings.groq_model}): {response.content[:50]}...")
         return True